@@ -1,14 +1,12 @@
-from matplotlib.collections import LineCollection
 import numpy as np
-import matplotlib.pyplot as plt
 import math
-from scipy.sparse import csr_matrix
-from scipy.sparse.csgraph import shortest_path
-from scipy.spatial import cKDTree
 import time
 
 """
 Pathfinding program created by Rikard Radovac and Péter Gaal in the course DAT171
+
+Only NumPy is imported up front, so the routing functions can be used by headless workers without
+matplotlib. Plotting and the SciPy submodules are imported inside the functions that use them, on first use.
 """
 
 
@@ -50,6 +48,8 @@ def plot_points(coord_list, indices, graph):
     :param graph: List of shortest nodes to connect.
     :return:
     """
+    import matplotlib.pyplot as plt
+    from matplotlib.collections import LineCollection
     fig = plt.figure()
     ax = fig.add_subplot(1, 1, 1)
 
@@ -81,46 +81,291 @@ def plot_points(coord_list, indices, graph):
     plt.show()
 
 
-def construct_graph_connections(coord_list, radius):
+PROGRESS_INTERVAL = 1024  # Number of cities handled between two progress reports
+
+
+class BuildCancelled(Exception):
+    """Raised when a progress callback asks a graph build to stop"""
+
+
+def report_progress(progress, start_time, processed, total, edges):
+    """
+    Calls a progress callback with the counters and the estimated time left of a build, and stops the
+    build if the callback returns True. A True from the last call, when every city is processed, is ignored
+    since the build is already complete
+    :param progress: Callback progress(processed, total, edges, time_left), or None
+    :param start_time: The time.time() when the build started
+    :param processed: Number of cities handled so far
+    :param total: Total number of cities
+    :param edges: Number of city-connections found so far
+    """
+    if progress is None:
+        return
+    elapsed = time.time() - start_time
+    time_left = elapsed * (total - processed) / processed if processed else math.inf
+    if progress(processed, total, edges, time_left) and processed < total:
+        raise BuildCancelled(f"Graph build cancelled after {processed} of {total} cities")
+
+
+def construct_graph_connections(coord_list, radius, progress=None):
     """
     Constructs all possible city-connections that satisfy the criteria.
     :param coord_list: 2D array of coordinates
     :param radius: The max distance between each point
+    :param progress: Callback progress(processed, total, edges, time_left) called every PROGRESS_INTERVAL
+        cities, returning True cancels the build with BuildCancelled
     :return indices: 2D array of the indices of cities which satisfy the maximum distance
     :return distances: 1D array of the distance between each city-pair
     """
+    start_time = time.time()
     indices = []
     distances = []
     for ind, coordinate in enumerate(coord_list):
+        if ind % PROGRESS_INTERVAL == 0:
+            report_progress(progress, start_time, ind, len(coord_list), len(indices))
         distance = np.sqrt((coord_list[ind + 1:, 0] - coordinate[0]) ** 2 +  # distances between every city
                            (coord_list[ind + 1:, 1] - coordinate[1]) ** 2)   # without duplicates
         for ind2, value in enumerate(distance):
             if value <= radius:
                 indices.append([ind, ind2 + ind + 1])
                 distances.append(value)
+    report_progress(progress, start_time, len(coord_list), len(coord_list), len(indices))
     return np.array(indices), np.array(distances)
 
 
-def construct_fast_graph_connections(coord_list, radius):
+def construct_fast_graph_connections(coord_list, radius, progress=None):
     """
     Rapidly constructs all possible city-connections that satisfy the criteria using cKDTree
     :param coord_list: 2D array of coordinates
     :param radius: The max distance between each point
+    :param progress: Callback progress(processed, total, edges, time_left) called every PROGRESS_INTERVAL
+        cities, returning True cancels the build with BuildCancelled
     :return indices: 2D array of the indices of cities which satisfy the maximum distance
     :return distances: 1D array of the distances between each city-pair
     """
+    from scipy.spatial import cKDTree
+    start_time = time.time()
     tree = cKDTree(coord_list)
     indices = []
     distances = []
-    nearby_indices = tree.query_ball_point(coord_list, radius)
-    for ind, value in enumerate(nearby_indices):
-        for ind2 in value:
-            if ind < ind2:
-                indices.append([ind, ind2])
-                distances.append(math.dist(coord_list[ind], coord_list[ind2]))
+    for begin in range(0, len(coord_list), PROGRESS_INTERVAL):
+        report_progress(progress, start_time, begin, len(coord_list), len(indices))
+        nearby_indices = tree.query_ball_point(coord_list[begin:begin + PROGRESS_INTERVAL], radius)
+        for ind, value in enumerate(nearby_indices, begin):
+            for ind2 in value:
+                if ind < ind2:
+                    indices.append([ind, ind2])
+                    distances.append(math.dist(coord_list[ind], coord_list[ind2]))
+    report_progress(progress, start_time, len(coord_list), len(coord_list), len(indices))
     return np.array(indices), np.array(distances)
 
 
+def construct_connections_with_timeout(coord_list, radius, timeout, builder=None, shrink=0.5, attempts=3):
+    """
+    Builds the city-connections, retrying with a smaller radius each time a build takes longer than the timeout
+    :param coord_list: 2D array of coordinates
+    :param radius: The max distance between each point for the first attempt
+    :param timeout: The max time in seconds for each attempt
+    :param builder: construct_fast_graph_connections (default) or construct_graph_connections
+    :param shrink: The factor the radius is multiplied with after a timed out attempt
+    :param attempts: The max number of attempts
+    :return indices: 2D array of the indices of cities which satisfy the maximum distance
+    :return distances: 1D array of the distances between each city-pair
+    :return radius: The radius that was used
+    """
+    builder = builder or construct_fast_graph_connections
+    for attempt in range(attempts):
+        deadline = time.time() + timeout
+        try:
+            indices, distances = builder(coord_list, radius, progress=lambda *counters: time.time() > deadline)
+            return indices, distances, radius
+        except BuildCancelled:
+            radius *= shrink
+    raise BuildCancelled(f"No graph could be built within {timeout} s in {attempts} attempts")
+
+
+def construct_knn_graph_connections(coord_list, neighbours):
+    """
+    Constructs city-connections from every city to its nearest neighbours using cKDTree. Components that
+    end up disconnected are joined with as few extra connections as possible (one less than the number
+    of components), always using the shortest connection available.
+    :param coord_list: 2D array of coordinates
+    :param neighbours: The number of nearest cities to connect each city to
+    :return indices: 2D array of the indices of connected cities
+    :return distances: 1D array of the distances between each city-pair
+    """
+    from scipy.spatial import cKDTree
+    N = len(coord_list)
+    tree = cKDTree(coord_list)
+    k = min(neighbours, N - 1)
+    if k < 1:
+        return np.zeros((0, 2), dtype=int), np.zeros(0)
+    nearby_distances, nearby_indices = tree.query(coord_list, k=k + 1)
+    # The city itself is usually the first neighbour, but cities on the same coordinates can come in any order,
+    # so remove it by index. Where it is not among the k + 1, the farthest neighbour is left out instead.
+    neighbour = nearby_indices != np.arange(N)[:, None]
+    neighbour[neighbour.sum(axis=1) > k, -1] = False
+    pairs = np.column_stack((np.nonzero(neighbour)[0], nearby_indices[neighbour]))
+    pairs.sort(axis=1)
+    indices, unique = np.unique(pairs, axis=0, return_index=True)
+    distances = nearby_distances[neighbour][unique]
+
+    extra_indices, extra_distances = connect_components(coord_list, tree, indices, distances)
+    return np.vstack((indices, extra_indices)), np.concatenate((distances, extra_distances))
+
+
+def connect_components(coord_list, tree, indices, distances):
+    """
+    Finds the shortest connections that join all components of a graph (Boruvka's algorithm on the
+    components). Each round connects every component to its nearest city outside of it.
+    :param coord_list: 2D array of coordinates
+    :param tree: cKDTree of coord_list
+    :param indices: 2D array of the indices of already connected cities
+    :param distances: 1D array of the distances between each city-pair
+    :return extra_indices: 2D array of the added city-pairs
+    :return extra_distances: 1D array of the distances of the added city-pairs
+    """
+    from scipy.sparse.csgraph import connected_components
+    N = len(coord_list)
+    extra_indices = []
+    extra_distances = []
+    graph = construct_graph(indices, distances, N)
+    n_components, labels = connected_components(graph, directed=False)
+
+    while n_components > 1:
+        # Nearest city in another component for every city, querying more neighbours until one is found
+        best_distance = np.full(N, np.inf)
+        best_city = np.full(N, -1)
+        pending = np.arange(N)
+        k = 2
+        while len(pending) > 0:
+            k = min(2 * k, N)
+            nearby_distances, nearby_indices = tree.query(coord_list[pending], k=k)
+            outside = labels[nearby_indices] != labels[pending, None]
+            found = outside.any(axis=1)
+            first = outside.argmax(axis=1)[found]
+            best_distance[pending[found]] = nearby_distances[found, first]
+            best_city[pending[found]] = nearby_indices[found, first]
+            # Cities whose queried neighbourhood is already wider than their component's best connection
+            # can not improve on it, so only the others are queried further
+            component_best = np.full(n_components, np.inf)
+            np.minimum.at(component_best, labels, best_distance)
+            unfinished = ~found & (nearby_distances[:, -1] < component_best[labels[pending]])
+            pending = pending[unfinished & (k < N)]
+
+        # The shortest outgoing connection of each component, merged shortest first
+        parent = list(range(n_components))
+
+        def root(component):
+            while parent[component] != component:
+                parent[component] = parent[parent[component]]
+                component = parent[component]
+            return component
+
+        order = np.lexsort((best_distance, labels))
+        first_of_component = np.unique(labels[order], return_index=True)[1]
+        candidates = order[first_of_component]
+        for city in candidates[np.argsort(best_distance[candidates])]:
+            a, b = root(labels[city]), root(labels[best_city[city]])
+            if a != b:
+                parent[a] = b
+                extra_indices.append(sorted((city, best_city[city])))
+                extra_distances.append(best_distance[city])
+
+        roots, labels = np.unique([root(label) for label in labels], return_inverse=True)
+        n_components = len(roots)
+
+    return np.array(extra_indices, dtype=int).reshape(-1, 2), np.array(extra_distances)
+
+
+def prune_graph_connections(coord_list, indices, distances, mode="exact"):
+    """
+    Removes city-connections that no shortest path needs because a detour through a third city is
+    short enough. Only detours over existing connections are considered.
+
+    - "exact" removes connections that are at least as long as a two-hop detour, all distances stay the same
+    - "gabriel" removes connections whose diametral circle holds the detour city, distances grow at most sqrt(2)
+    - "rng" removes connections longer than both detour connections, distances grow at most 2
+
+    For the approximate modes the connections are handled shortest first and a detour is only used if both
+    of its connections are kept, which is what bounds the growth of the distances.
+    :param coord_list: 2D array of coordinates
+    :param indices: 2D array of the indices of connected cities
+    :param distances: 1D array of the distance between each city-pair
+    :param mode: "exact", "gabriel" or "rng"
+    :return indices: 2D array of the indices of the kept city-pairs
+    :return distances: 1D array of the distances of the kept city-pairs
+    """
+    stretch = {"exact": 1, "gabriel": math.sqrt(2), "rng": 2}[mode]
+    N = len(coord_list)
+    E = len(indices)
+    indices = np.sort(indices, axis=1)
+    keys = indices[:, 0].astype(np.int64) * N + indices[:, 1]
+    key_order = np.argsort(keys)
+
+    # Every pair of connections sharing a city (u-w, w-v) that also has a direct connection u-v
+    cities = np.concatenate((indices[:, 0], indices[:, 1]))
+    neighbours = np.concatenate((indices[:, 1], indices[:, 0]))
+    edge_ids = np.concatenate((np.arange(E), np.arange(E)))
+    order = np.argsort(cities, kind="stable")
+    neighbours, edge_ids = neighbours[order], edge_ids[order]
+    starts = np.searchsorted(cities[order], np.arange(N + 1))
+
+    first_legs = []
+    second_legs = []
+    centres = []
+    for city in range(N):
+        degree = starts[city + 1] - starts[city]
+        if degree < 2:
+            continue
+        a, b = np.triu_indices(degree, 1)
+        first_legs.append(edge_ids[starts[city] + a])
+        second_legs.append(edge_ids[starts[city] + b])
+        centres.append(np.full(len(a), city))
+    if not first_legs:
+        return indices, distances
+    first_legs = np.concatenate(first_legs)
+    second_legs = np.concatenate(second_legs)
+    centres = np.concatenate(centres)
+
+    # The far ends of the two connections, the centre city is subtracted from each pair of indices
+    ends = np.sort(np.column_stack((indices[first_legs].sum(axis=1) - centres,
+                                    indices[second_legs].sum(axis=1) - centres)), axis=1)
+    detour_keys = ends[:, 0].astype(np.int64) * N + ends[:, 1]
+    position = np.minimum(np.searchsorted(keys, detour_keys, sorter=key_order), E - 1)
+    has_edge = keys[key_order[position]] == detour_keys
+    edges = key_order[position[has_edge]]
+    first_legs, second_legs = first_legs[has_edge], second_legs[has_edge]
+
+    length = distances[edges]
+    first, second = distances[first_legs], distances[second_legs]
+    shorter_legs = (first < length) & (second < length)
+    if mode == "exact":
+        valid = shorter_legs & (first + second <= length)
+    elif mode == "gabriel":
+        valid = shorter_legs & (first ** 2 + second ** 2 < length ** 2)
+    else:
+        valid = shorter_legs
+    edges, first_legs, second_legs = edges[valid], first_legs[valid], second_legs[valid]
+
+    keep = np.ones(E, dtype=bool)
+    if mode == "exact":
+        keep[edges] = False
+    else:
+        # Shortest connections first, so both detour connections are settled before they are relied on
+        by_edge = np.argsort(edges, kind="stable")
+        edges, first_legs, second_legs = edges[by_edge], first_legs[by_edge], second_legs[by_edge]
+        candidate_starts = np.searchsorted(edges, np.arange(E + 1))
+        for edge in np.argsort(distances, kind="stable"):
+            begin, end = candidate_starts[edge], candidate_starts[edge + 1]
+            if begin < end and (keep[first_legs[begin:end]] & keep[second_legs[begin:end]]).any():
+                keep[edge] = False
+
+    print(f"Pruned {E - keep.sum()} of {E} connections ({100 * (E - keep.sum()) / max(E, 1):.1f}%), "
+          f"distances grow at most a factor {stretch:.3f}")
+    return indices[keep], distances[keep]
+
+
 def construct_graph(indices, distances, N):
     """
     Constructs a graph (compressed sparse row matrix) of paired cities.
@@ -129,31 +374,557 @@ def construct_graph(indices, distances, N):
     :param N: Total number of pairs in indices
     :return graph: Compressed sparse row matrix of the indices combined with distances
     """
+    from scipy.sparse import csr_matrix
 
     graph = (csr_matrix((distances, (indices[:, 0], indices[:, 1])), shape=(N, N)))
     return graph
 
 
-def find_shortest_path(graph, start_node, end_node):
+class DynamicGraph:
+    """
+    A graph of cities connected within a radius that cities can be added to and removed from without
+    rebuilding it. The connections from the last rebuild are kept as a base together with an overlay of
+    added connections and removed cities, which is folded into the base once it grows too large.
+    City indices never change, a removed city is left without connections.
+
+    :param coord_list: 2D array of coordinates
+    :param radius: The max distance between each point
+    :param compact_fraction: How large the overlay may grow, relative to the base, before it is folded in
+    """
+
+    def __init__(self, coord_list, radius, compact_fraction=0.1):
+        self.radius = radius
+        self.compact_fraction = compact_fraction
+        self.size = len(coord_list)
+        self._coordinates = np.array(coord_list, dtype=float).reshape(-1, 2)
+        self._alive = np.ones(self.size, dtype=bool)
+        indices, distances = construct_fast_graph_connections(self._coordinates, radius)
+        self._set_base(indices.reshape(-1, 2), distances)
+
+    def _set_base(self, indices, distances):
+        """Makes the given connections the base and starts a new, empty overlay"""
+        from scipy.spatial import cKDTree
+        self.base_indices = indices.astype(int)
+        self.base_distances = distances.astype(float)
+        self.tree = cKDTree(self._coordinates[:self.size])
+        self.tree_size = self.size
+        self.added_indices = []
+        self.added_distances = []
+        self.removed_count = 0
+        self._graph = None
+
+    @property
+    def coordinates(self):
+        """2D array of the coordinates of every city, including removed ones"""
+        return self._coordinates[:self.size]
+
+    @property
+    def alive(self):
+        """1D boolean array which is False for removed cities"""
+        return self._alive[:self.size]
+
+    def insert_city(self, coordinate):
+        """
+        Adds a city and connects it to every city within the radius
+        :param coordinate: The xy-coordinate of the city, converted like in read_coordinate_file
+        :return index: The index of the new city
+        """
+        if self.size == len(self._coordinates):  # Double the storage so insertions stay cheap
+            capacity = max(2 * self.size, 16)
+            self._coordinates = np.resize(self._coordinates, (capacity, 2))
+            self._alive = np.resize(self._alive, capacity)
+        index = self.size
+        self._coordinates[index] = coordinate
+        self._alive[index] = True
+        self.size += 1
+
+        # Cities from the last rebuild are found with the tree, newer ones are few enough to check directly
+        nearby = np.array(self.tree.query_ball_point(coordinate, self.radius), dtype=int)
+        newer = np.arange(self.tree_size, index)
+        newer_distance = np.sqrt(((self._coordinates[newer] - coordinate) ** 2).sum(axis=1))
+        nearby = np.concatenate((nearby, newer[newer_distance <= self.radius]))
+        nearby = nearby[self._alive[nearby]]
+        for city in nearby:
+            self.added_indices.append([city, index])
+            self.added_distances.append(math.dist(self._coordinates[city], coordinate))
+
+        self._graph = None
+        self._compact_if_needed()
+        return index
+
+    def remove_city(self, index):
+        """
+        Removes a city and all of its connections
+        :param index: The index of the city to remove
+        """
+        if not self.alive[index]:
+            raise ValueError(f"City {index} is already removed")
+        self._alive[index] = False
+        self.removed_count += 1
+        self._graph = None
+        self._compact_if_needed()
+
+    def connections(self):
+        """
+        Returns the current city-connections, in the same form as construct_fast_graph_connections
+        :return indices: 2D array of the indices of connected cities
+        :return distances: 1D array of the distances between each city-pair
+        """
+        indices = np.vstack((self.base_indices, np.array(self.added_indices, dtype=int).reshape(-1, 2)))
+        distances = np.concatenate((self.base_distances, self.added_distances))
+        keep = self.alive[indices[:, 0]] & self.alive[indices[:, 1]]
+        return indices[keep], distances[keep]
+
+    @property
+    def graph(self):
+        """The current compressed sparse row matrix, rebuilt only after a change"""
+        if self._graph is None:
+            indices, distances = self.connections()
+            self._graph = construct_graph(indices, distances, self.size)
+        return self._graph
+
+    def compact(self):
+        """Folds the overlay into the base and rebuilds the tree"""
+        self._set_base(*self.connections())
+
+    def _compact_if_needed(self):
+        overlay = (self.size - self.tree_size) + self.removed_count
+        if overlay > self.compact_fraction * self.tree_size:
+            self.compact()
+
+
+def find_shortest_path(graph, start_node, end_node, coord_list=None):
     """
     Finds the shortest path between two nodes in a constructed graph
     :param graph: Compressed sparse row matrix of the indices combined with distances
     :param start_node: The city to find the shortest path from
     :param end_node: The city to find the shortest path to
+    :param coord_list: 2D array of coordinates, lets the planner consider bidirectional search
     :return path: The shortest path city-sequence
     :return path[::-1]: the shortest path city-sequence in order from start to end
     :return dist_matrix[0, end_node]: The total distance between start and end
     """
-    dist_matrix, predecessor = shortest_path(csgraph=graph, directed=False, indices=start_node,
-                                             return_predecessors=True)
-    print(f"The distance between start and end: {dist_matrix[end_node]}")
+    [(path, distance)] = find_shortest_paths(graph, [(start_node, end_node)], coord_list)
+    print(f"The distance between start and end: {distance}")
+    print(f"The sequence of cities: {path}")
+    return path, distance
+
 
+def trace_path(predecessor, end_node):
+    """
+    Walks a predecessor array backwards from the end node to the source it was computed from
+    :param predecessor: 1D array of predecessors from shortest_path
+    :param end_node: The city to walk back from
+    :return path[::-1]: the city-sequence in order from the source to the end node
+    """
     path = [end_node]  # list of cities starting from the end
     while predecessor[end_node] > -9999:
         path.append(predecessor[end_node])  # Appending the previously visited city
         end_node = predecessor[end_node]
-    print(f"The sequence of cities: {path[::-1]}")
-    return path[::-1], dist_matrix[end_node]
+    return path[::-1]
+
+
+BIDIRECTIONAL_OVERHEAD = 30000  # The Python work of one bidirectional query, counted in search operations
+
+
+def plan_shortest_paths(graph, queries, coord_list=None):
+    """
+    Chooses how to answer a list of start/end queries from the size of the graph and the query pattern
+    - "all_pairs": Floyd-Warshall once, when that is cheaper than one Dijkstra search per start
+    - "bidirectional": searches from both ends that stop when they meet, for a few queries between cities
+      that are close compared to the size of the map (needs the coordinates)
+    - "dijkstra": one Dijkstra search, when all queries share their start
+    - "multi_source": one batched Dijkstra call with every distinct start
+    :param graph: Compressed sparse row matrix of the indices combined with distances
+    :param queries: List of (start_node, end_node) pairs
+    :param coord_list: 2D array of coordinates, used to estimate how much of the map a search visits
+    :return method: The chosen method
+    :return cost: The expected number of operations
+    """
+    N = graph.shape[0]
+    E = graph.nnz
+    sources = len({start for start, end in queries})
+    dijkstra_cost = E + N * math.log2(max(N, 2))
+    all_pairs_cost = N ** 3
+
+    bidirectional_cost = np.inf
+    if coord_list is not None and N > 0:
+        # Storing the graph in both directions costs about one full search. Each query then runs a few rounds
+        # of two searches that cover circles of about 0.6 times the straight line distance
+        map_area = max(np.prod(np.ptp(coord_list, axis=0)), 1e-300)
+        bidirectional_cost = dijkstra_cost
+        for start, end in queries:
+            radius = 0.6 * math.dist(coord_list[start], coord_list[end])
+            bidirectional_cost += min(1.0, 2 * math.pi * radius ** 2 / map_area) * dijkstra_cost + 4 * N \
+                + BIDIRECTIONAL_OVERHEAD
+
+    if all_pairs_cost < sources * dijkstra_cost:
+        method, cost = "all_pairs", all_pairs_cost
+    elif bidirectional_cost < sources * dijkstra_cost:
+        method, cost = "bidirectional", bidirectional_cost
+    elif sources == 1:
+        method, cost = "dijkstra", dijkstra_cost
+    else:
+        method, cost = "multi_source", sources * dijkstra_cost
+    print(f"Shortest path method: {method} for {len(queries)} queries from {sources} cities "
+          f"({N} cities, {E} connections), expected cost {cost:.3g} operations")
+    return method, cost
+
+
+def find_shortest_paths(graph, queries, coord_list=None):
+    """
+    Finds the shortest paths for a list of start/end queries with the method from plan_shortest_paths
+    :param graph: Compressed sparse row matrix of the indices combined with distances
+    :param queries: List of (start_node, end_node) pairs
+    :param coord_list: 2D array of coordinates, lets the planner consider bidirectional search
+    :return results: List of (path, distance) for each query, the path is empty if the end can't be reached
+    """
+    from scipy.sparse.csgraph import shortest_path, dijkstra
+    method, cost = plan_shortest_paths(graph, queries, coord_list)
+    if method == "bidirectional":
+        symmetric_graph = graph.maximum(graph.T).tocsr()
+        return [find_bidirectional_path(graph, start, end, symmetric_graph,
+                                        math.dist(coord_list[start], coord_list[end])) for start, end in queries]
+
+    sources = list(dict.fromkeys(start for start, end in queries))
+    if method == "all_pairs":
+        dist_matrix, predecessors = shortest_path(csgraph=graph, method="FW", directed=False,
+                                                  return_predecessors=True)
+        rows = {source: source for source in sources}
+    else:
+        dist_matrix, predecessors = dijkstra(csgraph=graph, directed=False, indices=sources,
+                                             return_predecessors=True)
+        dist_matrix, predecessors = dist_matrix.reshape(len(sources), -1), predecessors.reshape(len(sources), -1)
+        rows = {source: row for row, source in enumerate(sources)}
+
+    results = []
+    for start, end in queries:
+        distance = dist_matrix[rows[start], end]
+        path = trace_path(predecessors[rows[start]], end) if np.isfinite(distance) else []
+        results.append((path, distance))
+    return results
+
+
+def find_bidirectional_path(graph, start_node, end_node, symmetric_graph=None, lower_bound=0):
+    """
+    Finds the shortest path with two Dijkstra searches, from the start and from the end, that are limited to
+    a distance L. The best path over a connection between the two searched areas is the shortest path once it
+    is at most 2L long, so only cities closer than about half the distance to either end are visited.
+    :param graph: Compressed sparse row matrix of the indices combined with distances
+    :param start_node: The city to find the shortest path from
+    :param end_node: The city to find the shortest path to
+    :param symmetric_graph: graph with every connection stored in both directions, to reuse between queries
+    :param lower_bound: A distance the path is known to be at least as long as, e.g. the straight line distance
+    :return path: The shortest path city-sequence, empty if the end can't be reached
+    :return distance: The total distance between start and end
+    """
+    from scipy.sparse.csgraph import dijkstra
+    if symmetric_graph is None:
+        symmetric_graph = graph.maximum(graph.T).tocsr()
+    limit = max(0.6 * lower_bound, 4 * symmetric_graph.data.mean() if symmetric_graph.nnz else 1.0)
+    while True:
+        dist_matrix, predecessors = dijkstra(csgraph=symmetric_graph, indices=[start_node, end_node],
+                                             return_predecessors=True, limit=limit)
+        from_start, from_end = dist_matrix
+
+        # Best path through a city reached from both ends, or over a connection out of the area around the start
+        through_city = from_start + from_end
+        best_city = np.argmin(through_city)
+        best = through_city[best_city]
+        best_connection = None
+        area = np.flatnonzero(np.isfinite(from_start))
+        outgoing = symmetric_graph[area].tocoo()
+        if outgoing.nnz:
+            over_connection = from_start[area[outgoing.row]] + outgoing.data + from_end[outgoing.col]
+            connection = np.argmin(over_connection)
+            if over_connection[connection] < best:
+                best = over_connection[connection]
+                best_connection = area[outgoing.row[connection]], outgoing.col[connection]
+
+        if best <= 2 * limit:
+            break
+        if np.isfinite(best):
+            limit = best / 2  # The next search is guaranteed to be exact
+            continue
+
+        # The areas haven't met. If either one has no connection out of it, it holds every city its end can
+        # reach, so the other end can't be reached. Otherwise the limit grows at least past the nearest city
+        # outside the areas, so the next searches reach a new city however long the connection to it is
+        boundary = np.inf
+        for searched in dist_matrix:
+            area = np.flatnonzero(np.isfinite(searched))
+            outgoing = symmetric_graph[area].tocoo()
+            leaving = ~np.isfinite(searched[outgoing.col])
+            if not leaving.any():
+                return [], np.inf
+            boundary = min(boundary, (searched[area[outgoing.row[leaving]]] + outgoing.data[leaving]).min())
+        limit = max(1.5 * limit, boundary)
+
+    if best_connection is not None:
+        u, v = best_connection
+        return trace_path(predecessors[0], u) + trace_path(predecessors[1], v)[::-1], best
+    return trace_path(predecessors[0], best_city) + trace_path(predecessors[1], best_city)[-2::-1], best
+
+
+def construct_stop_matrix(graph, stops):
+    """
+    Computes the shortest distances between every pair of stops with one shortest_path call
+    :param graph: Compressed sparse row matrix of the indices combined with distances
+    :param stops: 1D list of the cities to visit
+    :return stop_matrix: 2D array where stop_matrix[i, j] is the distance from stops[i] to stops[j]
+    :return predecessors: 2D array of predecessors, one row per stop, used to stitch the legs together
+    """
+    from scipy.sparse.csgraph import shortest_path
+    dist_matrix, predecessors = shortest_path(csgraph=graph, directed=False, indices=stops,
+                                              return_predecessors=True)
+    stop_matrix = dist_matrix[:, stops]
+    if np.isinf(stop_matrix).any():
+        raise ValueError("Every stop must be reachable from every other stop, try a larger radius")
+    return stop_matrix, predecessors
+
+
+def order_stops(stop_matrix, return_to_start=False):
+    """
+    Orders the stops with a nearest neighbour tour improved by 2-opt. The first stop is always kept first.
+    :param stop_matrix: 2D array of distances between the stops
+    :param return_to_start: True if the route should end where it started
+    :return order: List of row indices into stop_matrix in visiting order
+    """
+    n = len(stop_matrix)
+    order = [0]
+    unvisited = set(range(1, n))
+    while unvisited:
+        nearest = min(unvisited, key=lambda stop: stop_matrix[order[-1], stop])
+        order.append(nearest)
+        unvisited.remove(nearest)
+
+    if return_to_start:
+        order.append(0)
+
+    # 2-opt: reverse order[i:j + 1] whenever that shortens the two edges at its ends
+    last = len(order) - 1
+    furthest = last - 1 if return_to_start else last  # The closing stop must stay in place
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, furthest):
+            for j in range(i + 1, furthest + 1):
+                before = stop_matrix[order[i - 1], order[i]]
+                after = stop_matrix[order[i - 1], order[j]]
+                if j < last:  # The last stop of an open route has no outgoing edge
+                    before += stop_matrix[order[j], order[j + 1]]
+                    after += stop_matrix[order[i], order[j + 1]]
+                if after < before - 1e-12:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
+
+    if return_to_start:
+        order.pop()
+    return order
+
+
+def find_multi_stop_route(graph, stops, return_to_start=False):
+    """
+    Finds a short route through several cities, starting at the first one. The stop-to-stop distances are
+    computed once and every leg is stitched from the cached predecessors, so no extra shortest_path calls
+    are made while the stops are ordered.
+    :param graph: Compressed sparse row matrix of the indices combined with distances
+    :param stops: 1D list of the cities to visit, the first one is the start
+    :param return_to_start: True if the route should end where it started
+    :return path: The full city-sequence of the route
+    :return total_distance: The total distance of the route
+    :return stop_order: The stops in the order they are visited
+    """
+    stop_matrix, predecessors = construct_stop_matrix(graph, stops)
+    order = order_stops(stop_matrix, return_to_start)
+    if return_to_start:
+        order = order + [0]
+
+    path = [stops[order[0]]]
+    total_distance = 0
+    for row, next_row in zip(order[:-1], order[1:]):
+        leg = trace_path(predecessors[row], stops[next_row])
+        path.extend(leg[1:])
+        total_distance += stop_matrix[row, next_row]
+    return path, total_distance, [stops[row] for row in order]
+
+
+COLUMN_MAGIC = b"CA1COLS1"
+COLUMN_ALIGNMENT = 64  # Every column starts on a multiple of this many bytes
+COLUMN_ENTRY = np.dtype([("name", "S24"), ("dtype", "S8"), ("shape", "<u8", 2), ("offset", "<u8")])
+
+
+def write_columns(filename, columns):
+    """
+    Writes arrays to a columnar binary file. The file starts with COLUMN_MAGIC and the number of columns,
+    followed by one COLUMN_ENTRY per column (name, dtype, shape and byte offset) and the aligned raw data.
+    :param filename: The file to write
+    :param columns: Dictionary of column names and 1D or 2D arrays
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in columns.items()}
+    table = np.zeros(len(arrays), dtype=COLUMN_ENTRY)
+    offset = len(COLUMN_MAGIC) + 8 + table.nbytes
+    for entry, (name, array) in zip(table, arrays.items()):
+        offset += -offset % COLUMN_ALIGNMENT
+        shape = array.shape if array.ndim == 2 else (len(array), 0)
+        entry["name"], entry["dtype"], entry["shape"], entry["offset"] = name, array.dtype.str, shape, offset
+        offset += array.nbytes
+
+    with open(filename, "wb") as output:
+        output.write(COLUMN_MAGIC)
+        output.write(np.uint64(len(arrays)).tobytes())
+        output.write(table.tobytes())
+        for entry, array in zip(table, arrays.values()):
+            output.write(bytes(int(entry["offset"]) - output.tell()))
+            output.write(array.tobytes())
+
+
+def read_columns(filename):
+    """
+    Memory-maps the columns of a file written by write_columns, no data is read or copied until it is used
+    :param filename: The file to read
+    :return columns: Dictionary of column names and read-only arrays backed by the file
+    """
+    with open(filename, "rb") as file:
+        if file.read(len(COLUMN_MAGIC)) != COLUMN_MAGIC:
+            raise ValueError(f"{filename} is not a columnar CA1 file")
+        count = int(np.frombuffer(file.read(8), dtype="<u8")[0])
+        table = np.frombuffer(file.read(count * COLUMN_ENTRY.itemsize), dtype=COLUMN_ENTRY)
+
+    columns = {}
+    for entry in table:
+        rows, width = (int(size) for size in entry["shape"])
+        shape = (rows, width) if width else (rows,)
+        if rows == 0:
+            columns[entry["name"].decode()] = np.zeros(shape, dtype=entry["dtype"].decode())
+            continue
+        columns[entry["name"].decode()] = np.memmap(filename, dtype=entry["dtype"].decode(), mode="r",
+                                                    offset=int(entry["offset"]), shape=shape)
+    return columns
+
+
+def export_graph(filename, coord_list, indices, distances, graph=None, routes=None):
+    """
+    Exports the coordinates, city-connections, graph and route results to a columnar binary file
+    :param filename: The file to write
+    :param coord_list: 2D array of coordinates
+    :param indices: 2D array of the indices of connected cities
+    :param distances: 1D array of the distance between each city-pair
+    :param graph: Compressed sparse row matrix of the indices combined with distances, built if not given
+    :param routes: List of (path, distance) results, e.g. from find_shortest_paths
+    """
+    if graph is None:
+        graph = construct_graph(indices, distances, len(coord_list))
+    routes = routes or []
+    paths = [np.asarray(path, dtype=np.int64) for path, distance in routes]
+    write_columns(filename, {
+        "coordinates": np.asarray(coord_list, dtype=np.float64),
+        "indices": np.asarray(indices, dtype=np.int64).reshape(-1, 2),
+        "distances": np.asarray(distances, dtype=np.float64),
+        "graph_data": graph.data,
+        "graph_indices": graph.indices,
+        "graph_indptr": graph.indptr,
+        "route_cities": np.concatenate(paths) if paths else np.zeros(0, dtype=np.int64),
+        "route_offsets": np.cumsum([0] + [len(path) for path in paths], dtype=np.int64),
+        "route_distances": np.array([distance for path, distance in routes], dtype=np.float64),
+    })
+
+
+def import_graph(filename):
+    """
+    Imports a file written by export_graph. The arrays are memory-mapped, only the route lists are built.
+    :param filename: The file to read
+    :return coord_list: 2D array of coordinates
+    :return indices: 2D array of the indices of connected cities
+    :return distances: 1D array of the distance between each city-pair
+    :return graph: Compressed sparse row matrix sharing its arrays with the file
+    :return routes: List of (path, distance) results
+    """
+    from scipy.sparse import csr_matrix
+    columns = read_columns(filename)
+    coord_list = columns["coordinates"]
+    graph = csr_matrix((columns["graph_data"], columns["graph_indices"], columns["graph_indptr"]),
+                       shape=(len(coord_list), len(coord_list)), copy=False)
+    offsets = columns["route_offsets"]
+    routes = [(columns["route_cities"][begin:end], distance)
+              for begin, end, distance in zip(offsets[:-1], offsets[1:], columns["route_distances"])]
+    return coord_list, columns["indices"], columns["distances"], graph, routes
+
+
+def process_dataset(dataset):
+    """
+    Runs the read, connect, graph and route steps for one dataset and times each step
+    :param dataset: Dictionary with "Country", "Filepath", "Radius" and "Queries" (a list of start/end pairs),
+    and optionally "Prune" with a mode of prune_graph_connections
+    :return report: Dictionary with the country, the size of the graph, the step times and the route results
+    """
+    timings = {}
+    start_time = time.time()
+    coordinates = read_coordinate_file(dataset["Filepath"])
+    timings["reading file"] = time.time() - start_time
+
+    start_time = time.time()
+    indices, distances = construct_fast_graph_connections(coordinates, dataset["Radius"])
+    timings["construct graph connections"] = time.time() - start_time
+
+    if dataset.get("Prune"):
+        start_time = time.time()
+        indices, distances = prune_graph_connections(coordinates, indices, distances, dataset["Prune"])
+        timings["prune graph connections"] = time.time() - start_time
+
+    start_time = time.time()
+    graph = construct_graph(indices, distances, len(coordinates))
+    timings["construct graph"] = time.time() - start_time
+
+    start_time = time.time()
+    routes = find_shortest_paths(graph, [tuple(query) for query in dataset["Queries"]], coordinates)
+    timings["shortest paths"] = time.time() - start_time
+
+    return {"Country": dataset["Country"], "Cities": len(coordinates), "Connections": len(indices),
+            "Timings": timings, "Routes": [([int(city) for city in path], float(distance))
+                                           for path, distance in routes]}
+
+
+def run_batch(manifest, report_file="BatchOutput.txt", workers=None):
+    """
+    Processes every dataset of a manifest in a process pool and writes one timing report. The largest files
+    are started first, so parsing in one process overlaps with graph work in the others.
+    :param manifest: List of datasets as described in process_dataset, or the filename of a JSON manifest
+    :param report_file: The file to write the consolidated report to
+    :param workers: Number of processes, defaults to the number of CPUs
+    :return reports: List of reports from process_dataset, in manifest order
+    """
+    import json
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+
+    if isinstance(manifest, str):
+        directory = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, "r") as file:
+            manifest = json.load(file)
+        for dataset in manifest:  # Files in a manifest are relative to the manifest itself
+            dataset["Filepath"] = os.path.join(directory, dataset["Filepath"])
+
+    start_time = time.time()
+    order = sorted(range(len(manifest)), key=lambda ind: -os.path.getsize(manifest[ind]["Filepath"]))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {ind: pool.submit(process_dataset, manifest[ind]) for ind in order}
+        reports = [futures[ind].result() for ind in range(len(manifest))]
+    total_time = time.time() - start_time
+
+    with open(report_file, "w") as output:
+        for report in reports:
+            output.write(f"Country: {report['Country']} ({report['Cities']} cities, "
+                         f"{report['Connections']} connections)\n")
+            for step, step_time in report["Timings"].items():
+                output.write(f"{step} time: {step_time} \n")
+            for path, distance in report["Routes"]:
+                output.write(f"Route {path[0] if path else '-'} -> {path[-1] if path else '-'}: "
+                             f"distance {distance}, {len(path)} cities\n")
+            output.write("\n")
+        output.write(f"Total time for {len(reports)} datasets: {total_time} \n")
+        output.write(f"Sum of dataset times: {sum(sum(report['Timings'].values()) for report in reports)} \n")
+    return reports
 
 
 def main():
@@ -165,6 +936,7 @@ def main():
     choices = {
         "Country": ["Sample", "Hungary", "Germany"],
         "Radius": [0.08, 0.005, 0.0025],
+        "Neighbours": [3, 6, 6],
         "Start node": [0, 311, 1573],
         "End node": [5, 702, 10584],
         "Filepath": ["SampleCoordinates.txt", "HungaryCities.txt",
@@ -176,6 +948,7 @@ def main():
         if choice == "S" or choice == "s":
             country = choices["Country"][0]
             radius = choices["Radius"][0]
+            neighbours = choices["Neighbours"][0]
             start_node = choices["Start node"][0]
             end_node = choices["End node"][0]
             file = choices["Filepath"][0]
@@ -184,6 +957,7 @@ def main():
         if choice == "H" or choice == "h":
             country = choices["Country"][1]
             radius = choices["Radius"][1]
+            neighbours = choices["Neighbours"][1]
             start_node = choices["Start node"][1]
             end_node = choices["End node"][1]
             file = choices["Filepath"][1]
@@ -192,6 +966,7 @@ def main():
         if choice == "G" or choice == "g":
             country = choices["Country"][2]
             radius = choices["Radius"][2]
+            neighbours = choices["Neighbours"][2]
             start_node = choices["Start node"][2]
             end_node = choices["End node"][2]
             file = choices["Filepath"][2]
@@ -201,13 +976,28 @@ def main():
             continue
 
     while True:
-        choice = input("FAST for for fast connections, SLOW for slow (no use of cKDTree) \n")
+        choice = input("FAST for for fast connections, SLOW for slow (no use of cKDTree), "
+                       "KNN for nearest neighbour connections \n")
         if choice == "FAST" or choice == "fast":
             chosen_function = construct_fast_graph_connections
             break
         elif choice == "SLOW" or choice == "slow":
             chosen_function = construct_graph_connections
             break
+        elif choice == "KNN" or choice == "knn":
+            chosen_function = construct_knn_graph_connections
+            radius = neighbours  # The nearest neighbour builder takes a neighbour count instead of a radius
+            break
+        else:
+            print("Please retype your choice")
+            continue
+
+    while True:
+        choice = input("NONE to keep all connections, EXACT to prune the ones no shortest path needs, "
+                       "GABRIEL or RNG to prune more with slightly longer paths \n")
+        if choice.lower() in ("none", "exact", "gabriel", "rng"):
+            prune_mode = None if choice.lower() == "none" else choice.lower()
+            break
         else:
             print("Please retype your choice")
             continue
@@ -225,13 +1015,19 @@ def main():
     with open("Output.txt", "a") as output:
         output.write(f"construct graph connections time: {time.time() - start_time} \n")
 
+    if prune_mode:
+        start_time = time.time()
+        indices, distances = prune_graph_connections(coordinates, indices, distances, prune_mode)
+        with open("Output.txt", "a") as output:
+            output.write(f"prune graph connections time: {time.time() - start_time} \n")
+
     start_time = time.time()
     constructed_graph = construct_graph(indices, distances, len(coordinates))
     with open("Output.txt", "a") as output:
         output.write(f"construct graph time: {time.time() - start_time} \n")
 
     start_time = time.time()
-    city_sequence, total_distance = find_shortest_path(constructed_graph, start_node, end_node)
+    city_sequence, total_distance = find_shortest_path(constructed_graph, start_node, end_node, coordinates)
     with open("Output.txt", "a") as output:
         output.write(f"shortest path time: {time.time() - start_time} \n")
 
@@ -244,6 +1040,12 @@ def main():
         output.write(f"The total sequence of cities is {city_sequence}\n")
         output.write(f"The total distance between start and end is {total_distance}")
 
+    export_graph("Output.bin", coordinates, indices, distances, constructed_graph, [(city_sequence, total_distance)])
+
 
 if __name__ == "__main__":
-    main()
+    import sys
+    if len(sys.argv) > 1:  # python CA1.py manifest.json runs every dataset of the manifest
+        run_batch(sys.argv[1])
+    else:
+        main()
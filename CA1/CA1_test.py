@@ -0,0 +1,234 @@
+import time
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, shortest_path
+
+from CA1 import *
+
+
+def random_graph(N=300, radius=0.08, seed=1):
+    """Returns random coordinates, their connections within radius and the graph, with a few isolated cities"""
+    coordinates = np.random.default_rng(seed).random((N, 2))
+    indices, distances = construct_fast_graph_connections(coordinates, radius)
+    return coordinates, indices, distances, construct_graph(indices, distances, N)
+
+
+def path_length(graph, path):
+    """Returns the length of a path, failing if two of its cities are not connected"""
+    symmetric = graph.maximum(graph.T).tocsr()
+    lengths = [symmetric[u, v] for u, v in zip(path[:-1], path[1:])]
+    assert all(length > 0 for length in lengths)
+    return sum(lengths)
+
+
+@pytest.mark.parametrize("builder", [construct_graph_connections, construct_fast_graph_connections])
+def test_build_progress(builder):
+    """Tests the progress counters of the connection builders and cancelling a build"""
+    coordinates = np.random.default_rng(6).random((2500, 2))
+    calls = []
+    indices, distances = builder(coordinates, 0.02, progress=lambda *counters: calls.append(counters))
+    assert [processed for processed, total, edges, time_left in calls] == [0, 1024, 2048, 2500]
+    assert all(total == 2500 for processed, total, edges, time_left in calls)
+    assert [edges for processed, total, edges, time_left in calls][-1] == len(indices)
+    assert calls[0][3] == math.inf and calls[-1][3] == 0
+
+    with pytest.raises(BuildCancelled):
+        builder(coordinates, 0.02, progress=lambda processed, total, edges, time_left: processed >= 1024)
+
+    # Asking to stop at the last report, when every city is done, keeps the finished build
+    finished = builder(coordinates, 0.02, progress=lambda processed, total, edges, time_left: processed == total)
+    assert (finished[0] == indices).all() and (finished[1] == distances).all()
+
+
+def test_build_timeout():
+    """Tests that a build that runs out of time is retried with a smaller radius"""
+    coordinates = np.random.default_rng(7).random((2500, 2))
+    radii = []
+
+    def slow_for_large_radius(coord_list, radius, progress=None):
+        radii.append(radius)
+        if radius > 0.03:
+            time.sleep(0.2)
+        return construct_fast_graph_connections(coord_list, radius, progress)
+
+    indices, distances, radius = construct_connections_with_timeout(coordinates, 0.08, 0.1, slow_for_large_radius)
+    assert radii == [0.08, 0.04, 0.02] and radius == 0.02
+    expected = construct_fast_graph_connections(coordinates, 0.02)
+    assert (indices == expected[0]).all() and (distances == expected[1]).all()
+
+    with pytest.raises(BuildCancelled):
+        construct_connections_with_timeout(coordinates, 0.08, 0.1, slow_for_large_radius, attempts=2)
+
+
+def test_shortest_paths():
+    """Tests the shortest path finders against scipy, including ends that can't be reached"""
+    coordinates, indices, distances, graph = random_graph()
+    expected = shortest_path(graph, directed=False)
+    labels = connected_components(graph, directed=False)[1]
+    rng = np.random.default_rng(2)
+    queries = [tuple(query) for query in rng.integers(0, len(coordinates), (20, 2)).tolist()]
+    unreachable = next((start, end) for start, end in zip(range(len(coordinates)), range(len(coordinates))[::-1])
+                       if labels[start] != labels[end])
+    queries.append(unreachable)
+
+    for (start, end), (path, distance) in zip(queries, find_shortest_paths(graph, queries, coordinates)):
+        assert distance == pytest.approx(expected[start, end])
+        if np.isfinite(distance):
+            assert path[0] == start and path[-1] == end
+            assert path_length(graph, path) == pytest.approx(distance)
+        else:
+            assert len(path) == 0
+
+    symmetric_graph = graph.maximum(graph.T).tocsr()
+    for start, end in queries:
+        path, distance = find_bidirectional_path(graph, start, end, symmetric_graph,
+                                                 math.dist(coordinates[start], coordinates[end]))
+        assert distance == pytest.approx(expected[start, end])
+        if np.isfinite(distance):
+            assert path[0] == start and path[-1] == end
+            assert path_length(graph, path) == pytest.approx(distance)
+        else:
+            assert path == []
+        assert find_bidirectional_path(graph, start, end)[1] == pytest.approx(expected[start, end])
+
+    # Two long connections in a graph of short ones, the searches have to grow past both
+    rows, columns = [0, 1] + list(range(3, 203)), [1, 2] + list(range(4, 204))
+    bridged = csr_matrix(([10.0, 10.0] + [0.001] * 200, (rows, columns)), shape=(204, 204))
+    assert find_bidirectional_path(bridged, 0, 2) == ([0, 1, 2], 20.0)
+    assert find_bidirectional_path(bridged, 0, 203) == ([], np.inf)
+    assert find_bidirectional_path(bridged, 3, 203)[1] == pytest.approx(0.2)
+
+
+def test_plan_shortest_paths():
+    """Tests that the planner picks the method its cost model finds cheapest"""
+    coordinates, indices, distances, graph = random_graph(200, 0.1)
+    dijkstra_cost = graph.nnz + 200 * math.log2(200)
+    assert plan_shortest_paths(graph, [(0, 1)]) == ("dijkstra", dijkstra_cost)
+    assert plan_shortest_paths(graph, [(0, 1), (2, 3)]) == ("multi_source", 2 * dijkstra_cost)
+    # Floyd-Warshall only pays off on dense graphs where every city is a start
+    complete = csr_matrix(np.ones((10, 10)) - np.eye(10))
+    assert plan_shortest_paths(complete, [(city, 0) for city in range(10)]) == ("all_pairs", 1000)
+    assert plan_shortest_paths(complete, [(0, 9)])[0] == "dijkstra"
+
+
+def tour_length(stop_matrix, order, return_to_start=False):
+    """Returns the length of visiting the stops in order"""
+    order = order + order[:1] if return_to_start else order
+    return sum(stop_matrix[first, second] for first, second in zip(order[:-1], order[1:]))
+
+
+@pytest.mark.parametrize("return_to_start", [False, True])
+def test_multi_stop_route(return_to_start):
+    """Tests that a multi-stop route visits every stop along real connections, and the stop ordering"""
+    coordinates, indices, distances, graph = random_graph()
+    labels = connected_components(graph, directed=False)[1]
+    largest = np.argmax(np.bincount(labels))
+    stops = [int(city) for city in np.flatnonzero(labels == largest)[::23]]
+    assert len(stops) > 5
+
+    path, total_distance, stop_order = find_multi_stop_route(graph, stops, return_to_start)
+    assert path[0] == stops[0] and stop_order[0] == stops[0]
+    assert sorted(set(stop_order)) == sorted(stops) and set(stops) <= set(path)
+    assert path_length(graph, path) == pytest.approx(total_distance)
+    if return_to_start:
+        assert path[-1] == stops[0] and stop_order[-1] == stops[0] and len(stop_order) == len(stops) + 1
+    else:
+        assert path[-1] == stop_order[-1] and len(stop_order) == len(stops)
+
+    stop_matrix, predecessors = construct_stop_matrix(graph, stops)
+    order = order_stops(stop_matrix, return_to_start)
+    assert order[0] == 0 and sorted(order) == list(range(len(stops)))
+    nearest_neighbour = [0]
+    while len(nearest_neighbour) < len(stops):
+        nearest_neighbour.append(min(set(range(len(stops))) - set(nearest_neighbour),
+                                     key=lambda stop: stop_matrix[nearest_neighbour[-1], stop]))
+    assert tour_length(stop_matrix, order, return_to_start) <= \
+        tour_length(stop_matrix, nearest_neighbour, return_to_start) + 1e-12
+
+    unreachable = int(np.flatnonzero(labels != largest)[0])
+    with pytest.raises(ValueError):
+        find_multi_stop_route(graph, stops + [unreachable], return_to_start)
+
+
+def test_export_import(tmp_path):
+    """Tests that a graph and its routes come back unchanged from the columnar file, memory-mapped"""
+    coordinates, indices, distances, graph = random_graph()
+    labels = connected_components(graph, directed=False)[1]
+    unreachable = int(np.flatnonzero(labels != labels[0])[0])
+    routes = find_shortest_paths(graph, [(0, 5), (0, unreachable), (7, 7)], coordinates)
+    assert len(routes[1][0]) == 0
+    filename = str(tmp_path / "graph.bin")
+    export_graph(filename, coordinates, indices, distances, routes=routes)
+
+    imported_coordinates, imported_indices, imported_distances, imported_graph, imported_routes = \
+        import_graph(filename)
+    for array, imported in ((coordinates, imported_coordinates), (indices, imported_indices),
+                            (distances, imported_distances)):
+        assert isinstance(imported, np.memmap) and not imported.flags.writeable
+        assert imported.dtype == array.dtype and (imported == array).all()
+    assert (imported_graph != graph).nnz == 0
+    assert len(imported_routes) == len(routes)
+    for (path, distance), (imported_path, imported_distance) in zip(routes, imported_routes):
+        assert list(imported_path) == list(path) and imported_distance == distance
+
+    # Without routes the route columns are empty and aren't mapped
+    export_graph(filename, coordinates, indices, distances)
+    assert import_graph(filename)[4] == []
+    columns = read_columns(filename)
+    assert columns["route_cities"].shape == (0,) and not isinstance(columns["route_cities"], np.memmap)
+    assert columns["route_offsets"].tolist() == [0]
+
+    write_columns(filename, {"empty": np.zeros((0, 2), dtype=np.int32), "values": np.arange(3.0)})
+    columns = read_columns(filename)
+    assert columns["empty"].shape == (0, 2) and columns["empty"].dtype == np.int32
+    assert columns["values"].tolist() == [0.0, 1.0, 2.0]
+
+    bad = tmp_path / "bad.bin"
+    bad.write_bytes(b"CA1COLS0" + bytes(8))
+    with pytest.raises(ValueError):
+        import_graph(str(bad))
+
+
+def test_dynamic_graph():
+    """Tests that inserting and removing cities gives the same connections as building the graph again"""
+    coordinates = np.random.default_rng(3).random((200, 2))
+    dynamic = DynamicGraph(coordinates[:150], 0.1, compact_fraction=0.2)
+    for coordinate in coordinates[150:]:
+        dynamic.insert_city(coordinate)
+    for city in (0, 7, 151, 199):
+        dynamic.remove_city(city)
+    with pytest.raises(ValueError):
+        dynamic.remove_city(7)
+
+    alive = np.flatnonzero(dynamic.alive)
+    indices, distances = construct_fast_graph_connections(coordinates[alive], 0.1)
+    rebuilt = construct_graph(alive[indices], distances, len(coordinates))
+    graph = dynamic.graph
+    assert abs((graph.maximum(graph.T) - rebuilt.maximum(rebuilt.T))).max() < 1e-12
+    dynamic.compact()
+    assert np.allclose(shortest_path(dynamic.graph, directed=False), shortest_path(rebuilt, directed=False))
+
+
+def test_prune_exact():
+    """Tests that exact pruning removes connections but keeps every shortest distance"""
+    rng = np.random.default_rng(5)
+    line = np.column_stack((np.linspace(0, 1, 30), np.full(30, 0.5)))  # Detours along a line are exactly as long
+    coordinates = np.concatenate((rng.random((150, 2)), line))
+    indices, distances = construct_fast_graph_connections(coordinates, 0.15)
+    graph = construct_graph(indices, distances, len(coordinates))
+    pruned_indices, pruned_distances = prune_graph_connections(coordinates, indices, distances, "exact")
+    assert len(pruned_indices) < len(indices)
+    pruned = construct_graph(pruned_indices, pruned_distances, len(coordinates))
+    assert np.allclose(shortest_path(pruned, directed=False), shortest_path(graph, directed=False))
+
+
+def test_knn_connected():
+    """Tests that the nearest neighbour graph is connected and has no self-loops, also with shared coordinates"""
+    rng = np.random.default_rng(4)
+    clusters = np.concatenate((rng.random((100, 2)), rng.random((100, 2)) + 5))
+    coordinates = np.concatenate((clusters, clusters[:10]))  # Cities with the same coordinates as others
+    indices, distances = construct_knn_graph_connections(coordinates, 3)
+    assert (indices[:, 0] != indices[:, 1]).all()
+    graph = construct_graph(indices, distances, len(coordinates))
+    assert connected_components(graph, directed=False)[0] == 1
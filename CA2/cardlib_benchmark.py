@@ -0,0 +1,191 @@
+from itertools import chain, combinations
+import sys
+import time
+import numpy as np
+
+from cardlib import *
+
+"""Benchmarks of the cardlib hand evaluators and deck, and an exhaustive check of every five card hand.
+Run with `python cardlib_benchmark.py` for the benchmarks and add `verify` for the exhaustive check.
+Created by Rikard Radovac & Péter Gaal in the course DAT171 at Chalmers university of technology
+"""
+
+FIVE_CARD_TYPES = {
+    PokerHandType.straight_flush: 40,
+    PokerHandType.four_of_a_kind: 624,
+    PokerHandType.full_house: 3744,
+    PokerHandType.flush: 5108,
+    PokerHandType.straight: 10200,
+    PokerHandType.three_of_a_kind: 54912,
+    PokerHandType.two_pair: 123552,
+    PokerHandType.one_pair: 1098240,
+    PokerHandType.high_card: 1302540,
+}
+"""dict: Number of five card hands of every type, 2598960 in total"""
+
+FIVE_CARD_CLASSES = 7462
+"""int: Number of five card hands that are all different in strength"""
+
+_CHECKERS = [PokerHand.check_straight_flush, PokerHand.check_four_of_a_kind, PokerHand.check_full_house,
+             PokerHand.check_flush, PokerHand.check_straight, PokerHand.check_three_of_a_kind,
+             PokerHand.check_two_pair, PokerHand.check_one_pair, PokerHand.check_high_card]
+
+
+def checker_type(cards):
+    """Returns the hand type found by the step by step check methods, the original way of evaluating a hand"""
+    cards = sorted(cards)
+    for check in _CHECKERS:
+        found = check(cards)
+        if found:
+            return found[0]
+
+
+def reference_strengths(card_ids):
+    """Ranks five card hands straight from the poker rules, without any of the cardlib tables
+
+    Args:
+        card_ids (array): (M, 5) card ids
+
+    Returns:
+        (array, array): M reference keys that order the hands, and their PokerHandType values
+    """
+    ranks = -np.sort(-(card_ids >> 2), axis=1)
+    flush = (card_ids & 3 == (card_ids[:, :1] & 3)).all(axis=1)
+    distinct = (np.diff(ranks, axis=1) != 0).all(axis=1)
+    wheel = (ranks == [12, 3, 2, 1, 0]).all(axis=1)
+    straight = distinct & ((ranks[:, 0] - ranks[:, 4] == 4) | wheel)
+    straight_high = np.where(wheel, 3, ranks[:, 0])
+
+    # Order the ranks by how many times they occur, then by rank, so equal hands get equal keys
+    counts = (ranks[:, :, None] == ranks[:, None, :]).sum(axis=2)
+    grouped = np.take_along_axis(ranks, np.argsort(-(counts * 16 + ranks), axis=1, kind="stable"), axis=1)
+    pattern = -np.sort(-counts, axis=1)
+
+    types = np.select(
+        [straight & flush, pattern[:, 0] == 4, (pattern[:, 0] == 3) & (pattern[:, 3] == 2), flush, straight,
+         pattern[:, 0] == 3, (pattern[:, 0] == 2) & (pattern[:, 2] == 2), pattern[:, 0] == 2],
+        [PokerHandType.straight_flush.value, PokerHandType.four_of_a_kind.value, PokerHandType.full_house.value,
+         PokerHandType.flush.value, PokerHandType.straight.value, PokerHandType.three_of_a_kind.value,
+         PokerHandType.two_pair.value, PokerHandType.one_pair.value], PokerHandType.high_card.value)
+    packed = (grouped * 16 ** np.arange(4, -1, -1)).sum(axis=1)
+    keys = types * 16 ** 5 + np.where(straight, straight_high * 16 ** 4, packed)
+    return keys, types
+
+
+def all_five_card_hands():
+    """Returns the card ids of all 2598960 five card hands, (2598960, 5)"""
+    return np.fromiter(chain.from_iterable(combinations(range(52), 5)), dtype=np.int64).reshape(-1, 5)
+
+
+def _check_order(strengths, keys, engine):
+    """Checks that strengths order the hands exactly like the reference keys"""
+    order = np.argsort(strengths, kind="stable")
+    strengths, keys = strengths[order], keys[order]
+    same = np.diff(strengths) == 0
+    if not ((np.diff(keys) == 0) == same).all() or not (np.diff(keys) >= 0).all():
+        raise AssertionError(f"{engine} orders hands differently from the reference")
+
+
+def verify_five_card_hands(scalar: bool = True):
+    """Checks the evaluators on every five card hand against the reference ranking and the known counts
+
+    Args:
+        scalar (bool): Whether to also check evaluate_ids hand by hand, which takes some seconds
+
+    Returns:
+        int: Number of hands checked
+    """
+    hands = all_five_card_hands()
+    keys, types = reference_strengths(hands)
+    counts = np.bincount(types, minlength=10)
+    if {hand_type: int(counts[hand_type.value]) for hand_type in PokerHandType} != FIVE_CARD_TYPES:
+        raise AssertionError("The reference finds the wrong number of hands of some type")
+    if len(np.unique(keys)) != FIVE_CARD_CLASSES:
+        raise AssertionError("The reference finds the wrong number of different hands")
+
+    every_thousandth = hands[::1000]
+    if [checker_type([CARDS[card_id] for card_id in hand]).value for hand in every_thousandth.tolist()] \
+            != types[::1000].tolist():
+        raise AssertionError("The check methods find another hand type than the reference")
+
+    strengths, batch_types = evaluate_batch(hands)
+    if not (batch_types == types).all():
+        raise AssertionError("evaluate_batch finds the wrong hand type")
+    _check_order(strengths, keys, "evaluate_batch")
+    if scalar:
+        scalar_strengths = np.array([evaluate_ids(hand) for hand in hands.tolist()])
+        if not (scalar_strengths == strengths).all():
+            raise AssertionError("evaluate_ids and evaluate_batch disagree")
+    return len(hands)
+
+
+def _rate(function, items):
+    """Returns how many items per second function goes through"""
+    start_time = time.perf_counter()
+    function(items)
+    return len(items) / (time.perf_counter() - start_time)
+
+
+def benchmark(samples: int = 20000, seed=None):
+    """Times every evaluator on random five, six and seven card hands and prints the hands per second
+
+    Args:
+        samples (int): Hands per hand size, the slow reference checkers get a tenth
+        seed (int): Seed of the random hands
+
+    Returns:
+        dict: (engine, hand size) to hands per second
+    """
+    rates = {}
+    for size in (5, 6, 7):
+        card_ids = StandardDeck.shuffled_ids(samples, seed)[:, :size]
+        hands = [[CARDS[card_id] for card_id in row] for row in card_ids.tolist()]
+
+        def best_poker_hand(hands):
+            evaluation_cache.clear()
+            for cards in hands:
+                hand = Hand()
+                hand.cards = cards[:2]
+                hand.best_poker_hand(cards[2:])
+
+        def incremental(hands):
+            for cards in hands:
+                evaluator = HandEvaluator(cards[:2])
+                for card in cards[2:]:
+                    evaluator.add_card(card)
+                    evaluator.strength
+
+        engines = {
+            "check methods": (lambda hands: [checker_type(cards) for cards in hands], hands[:samples // 10]),
+            "PokerHand": (lambda hands: [PokerHand(cards) for cards in hands], hands),
+            "best_poker_hand": (best_poker_hand, hands),
+            "evaluate_ids": (lambda rows: [evaluate_ids(row) for row in rows], card_ids.tolist()),
+            "HandEvaluator by street": (incremental, hands),
+            "evaluate_batch": (evaluate_batch, card_ids),
+        }
+        for engine, (function, items) in engines.items():
+            rates[engine, size] = _rate(function, items)
+
+    print(f"{'Hands per second':<24}" + "".join(f"{f'{size} cards':>14}" for size in (5, 6, 7)))
+    for engine in engines:
+        print(f"{engine:<24}" + "".join(f"{rates[engine, size]:>14,.0f}" for size in (5, 6, 7)))
+
+    deck = StandardDeck(seed)
+
+    def shuffle_and_deal(rounds):
+        for _ in rounds:
+            deck.reset()
+            deck.shuffle()
+            deck.deal(9)
+
+    print(f"{'Deck shuffle and deal':<24}{_rate(shuffle_and_deal, range(samples)):>14,.0f} decks per second")
+    shuffled_ids = _rate(lambda decks: StandardDeck.shuffled_ids(len(decks), seed), range(samples))
+    print(f"{'shuffled_ids':<24}{shuffled_ids:>14,.0f} decks per second")
+    return rates
+
+
+if __name__ == "__main__":
+    benchmark()
+    if "verify" in sys.argv[1:]:
+        start = time.time()
+        print(f"Verified all {verify_five_card_hands()} five card hands in {time.time() - start:.1f} seconds")
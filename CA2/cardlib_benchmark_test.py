@@ -0,0 +1,12 @@
+from cardlib_benchmark import *
+
+
+def test_every_five_card_hand():
+    """Tests the evaluators on all 2598960 five card hands against the reference ranking"""
+    assert verify_five_card_hands(scalar=False) == sum(FIVE_CARD_TYPES.values()) == 2598960
+
+
+def test_benchmark():
+    """Tests that every engine is timed for every hand size"""
+    rates = benchmark(samples=200, seed=1)
+    assert len(rates) == 6 * 3 and all(rate > 0 for rate in rates.values())
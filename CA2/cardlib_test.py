@@ -203,5 +203,262 @@ def test_same_hand():
     assert b == c
 
 
-
-
+def test_interned_cards():
+    """Tests that equal cards are the same immutable, hashable object with a unique id"""
+    import pickle
+    assert NumberedCard(4, Suit.Hearts) is NumberedCard(4, Suit.Hearts)
+    assert KingCard(Suit.Spades) is make_card(13, Suit.Spades)
+    assert len({NumberedCard(4, Suit.Hearts), NumberedCard(4, Suit.Hearts), AceCard(Suit.Hearts)}) == 2
+    assert pickle.loads(pickle.dumps(QueenCard(Suit.Clubs))) is QueenCard(Suit.Clubs)
+
+    with pytest.raises(AttributeError):
+        KingCard(Suit.Spades).suit = Suit.Hearts
+
+    assert sorted(card.id for card in StandardDeck().cards) == list(range(52))
+    for card in StandardDeck().cards:
+        assert card_from_id(card.id) is card
+        assert card.suit in {Suit.Hearts, Suit.Spades, Suit.Clubs, Suit.Diamonds}
+
+    d1 = StandardDeck()
+    d2 = StandardDeck()
+    assert d1.cards is not d2.cards
+    assert all(c1 is c2 for c1, c2 in zip(d1.cards, d2.cards))
+
+
+def test_hand_strength():
+    """Tests the table evaluator on hand types and on ties the step by step checkers got wrong"""
+    def hand(*cards):
+        return PokerHand([make_card(value, Suit[suit]) for value, suit in cards])
+
+    royal = hand((14, "Hearts"), (13, "Hearts"), (12, "Hearts"), (11, "Hearts"), (10, "Hearts"), (2, "Clubs"))
+    assert royal.hand_type == PokerHandType.straight_flush
+    assert royal.values == 14
+
+    wheel = hand((14, "Hearts"), (2, "Clubs"), (3, "Spades"), (4, "Hearts"), (5, "Diamonds"))
+    six_high = hand((6, "Hearts"), (2, "Clubs"), (3, "Spades"), (4, "Hearts"), (5, "Diamonds"))
+    assert wheel.hand_type == PokerHandType.straight and wheel.values == 5
+    assert wheel < six_high
+
+    quads = hand((9, "Hearts"), (9, "Clubs"), (9, "Spades"), (9, "Diamonds"), (13, "Hearts"), (13, "Clubs"))
+    assert quads.hand_type == PokerHandType.four_of_a_kind
+    assert quads.values == (9, [13])
+
+    # Kings and twos beat sixes and fives
+    kings_up = hand((13, "Hearts"), (13, "Clubs"), (2, "Spades"), (2, "Hearts"), (4, "Diamonds"))
+    sixes_up = hand((6, "Hearts"), (6, "Clubs"), (5, "Spades"), (5, "Hearts"), (4, "Diamonds"))
+    assert kings_up.hand_type == sixes_up.hand_type == PokerHandType.two_pair
+    assert kings_up.values == ([2, 13], [4])
+    assert sixes_up < kings_up
+
+    # With three pairs the two highest count and the best remaining card is the kicker
+    three_pairs = hand((9, "Hearts"), (9, "Clubs"), (8, "Spades"), (8, "Hearts"), (2, "Diamonds"),
+                       (2, "Clubs"), (13, "Spades"))
+    assert three_pairs.values == ([8, 9], [13])
+
+    flush = hand((13, "Spades"), (7, "Spades"), (6, "Spades"), (3, "Spades"), (2, "Spades"), (14, "Hearts"))
+    assert flush.hand_type == PokerHandType.flush
+    assert flush.values == [KingCard(Suit.Spades), NumberedCard(7, Suit.Spades), NumberedCard(6, Suit.Spades),
+                            NumberedCard(3, Suit.Spades), NumberedCard(2, Suit.Spades)]
+    assert six_high < flush < quads < royal
+    assert isinstance(flush.strength, int)
+    assert evaluate(flush.cards) == flush.strength
+    assert strength_type(flush.strength) == PokerHandType.flush
+
+
+def test_evaluate_batch():
+    """Tests that the NumPy batch evaluator ranks random 5, 6 and 7 card hands exactly like evaluate"""
+    import numpy as np
+    rng = np.random.default_rng(2022)
+    for size in (5, 6, 7):
+        hands = np.argsort(rng.random((2000, 52)), axis=1)[:, :size]
+        strengths, types = evaluate_batch(hands)
+        for hand, strength, hand_type in zip(hands, strengths, types):
+            cards = [card_from_id(card_id) for card_id in hand]
+            assert strength == evaluate(cards)
+            assert hand_type == PokerHand(cards).hand_type.value
+
+
+def test_evaluation_cache():
+    """Tests that suit-isomorphic hands share a cache entry and that the cache evicts the oldest entries"""
+    cache = EvaluationCache(maxsize=2)
+    hearts = [AceCard(Suit.Hearts), KingCard(Suit.Hearts), NumberedCard(7, Suit.Spades)]
+    spades = [NumberedCard(7, Suit.Clubs), KingCard(Suit.Spades), AceCard(Suit.Spades)]
+    assert cache.strength(hearts) == cache.strength(spades) == evaluate(hearts)
+    assert cache.info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+
+    cache.strength([NumberedCard(2, Suit.Hearts)])
+    cache.strength([NumberedCard(3, Suit.Hearts)])
+    assert cache.info()["size"] == 2
+    cache.strength(hearts)
+    assert cache.info()["misses"] == 4  # The first hand was evicted
+
+    # Repeated cards can't be keyed by a card set, so they are evaluated without the cache
+    assert cache.strength([QueenCard(Suit.Hearts), QueenCard(Suit.Hearts)]) == \
+        evaluate([QueenCard(Suit.Hearts), QueenCard(Suit.Hearts)])
+    assert cache.info()["misses"] == 4
+
+    hand = Hand()
+    hand.add_card(AceCard(Suit.Hearts))
+    hand.add_card(KingCard(Suit.Hearts))
+    assert hand.best_poker_hand([NumberedCard(7, Suit.Spades)]) == PokerHand(hearts)
+    cache.clear()
+    assert cache.info() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 2}
+
+
+def test_array_deck():
+    """Tests drawing, dealing, resetting and seeded shuffling of the array backed deck"""
+    import numpy as np
+    d = StandardDeck(seed=1)
+    top = d.cards[:3]
+    assert d.deal(3) == top
+    assert len(d) == 49
+    d.draw()
+    d.reset()
+    assert len(d) == 52 and d == StandardDeck()
+
+    d1 = StandardDeck(seed=7)
+    d2 = StandardDeck(seed=7)
+    d1.shuffle()
+    d2.shuffle()
+    assert d1 == d2
+    assert sorted(card.id for card in d1.cards) == list(range(52))
+
+    d1.deal(52)
+    with pytest.raises(IndexError):
+        d1.draw()
+
+    decks = StandardDeck.shuffled_ids(1000, seed=3)
+    assert decks.shape == (1000, 52)
+    assert (np.sort(decks, axis=1) == np.arange(52)).all()
+    assert (decks == StandardDeck.shuffled_ids(1000, seed=3)).all()
+
+
+def test_hand_evaluator():
+    """Tests that the incremental evaluator follows the full evaluation street by street"""
+    deck = StandardDeck(seed=3)
+    for deal in range(200):
+        deck.reset()
+        deck.shuffle()
+        cards = deck.deal(7)
+        evaluator = HandEvaluator(cards[:2])
+        for street in (5, 6, 7):
+            evaluator.add_cards(cards[len(evaluator):street])
+            assert evaluator.strength == evaluate(cards[:street])
+            assert evaluator.hand_type == PokerHand(cards[:street]).hand_type
+
+    turn = evaluator.copy()
+    evaluator.clear()
+    assert len(evaluator) == 0 and len(turn) == 7
+    assert turn.best_poker_hand() == PokerHand(cards)
+    with pytest.raises(ValueError):
+        turn.add_card(cards[0])
+
+
+def test_outs():
+    """Tests the outs of a flush draw against counting by hand"""
+    hand = Hand()
+    hand.add_card(AceCard(Suit.Hearts))
+    hand.add_card(KingCard(Suit.Hearts))
+    flop = [NumberedCard(2, Suit.Hearts), NumberedCard(7, Suit.Hearts), QueenCard(Suit.Spades)]
+
+    outs = hand.outs(flop)
+    assert outs.hand_type == PokerHandType.high_card and outs.unseen == 47
+    # Nine hearts make a flush, three cards of each of A, K, Q, 7 and 2 make a pair, the queen of hearts is both
+    assert len(outs) == 23 and outs.hand_types.count(PokerHandType.flush) == 9
+    assert outs.next_street == pytest.approx(23 / 47)
+    for card, hand_type in zip(outs.cards, outs.hand_types):
+        assert PokerHand(hand.cards + flop + [card]).hand_type == hand_type
+    assert outs.next_street < outs.by_river < 1
+    assert sum(outs.river_types.values()) == pytest.approx(1)
+    assert outs.river_types[PokerHandType.flush] + outs.river_types.get(PokerHandType.straight_flush, 0) \
+        == pytest.approx(1 - 38 * 37 / (47 * 46))
+
+    turn = hand.outs(flop + [QueenCard(Suit.Hearts)])
+    assert turn.hand_type == PokerHandType.flush and turn.by_river == turn.next_street
+    with pytest.raises(ValueError):
+        hand.outs()
+
+
+def test_variants():
+    """Tests Omaha, Omaha Hi-Lo and short deck evaluation"""
+    # Five hearts make no flush in Omaha without three of them on the board
+    hole = [AceCard(Suit.Hearts), KingCard(Suit.Hearts), NumberedCard(2, Suit.Hearts), NumberedCard(3, Suit.Spades)]
+    board = [QueenCard(Suit.Hearts), JackCard(Suit.Hearts), NumberedCard(4, Suit.Diamonds),
+             NumberedCard(8, Suit.Clubs), NumberedCard(7, Suit.Spades)]
+    assert strength_type(evaluate(hole + board)) == PokerHandType.flush
+    high, low = evaluate_omaha(hole, board, hi_lo=True)
+    assert strength_type(high) == PokerHandType.high_card
+    assert low == 0x87421 and evaluate_omaha(hole, board[:3], hi_lo=True)[1] == NO_LOW
+    assert evaluate_omaha(hole, board) == high
+    strengths, lows = evaluate_omaha_batch([[card.id for card in hole]] * 2,
+                                           [[card.id for card in board], [card.id for card in board[::-1]]], True)
+    assert list(strengths) == [high, high] and list(lows) == [low, low]
+    with pytest.raises(ValueError):
+        evaluate_omaha(hole[:2], board)
+
+    # Short deck: a flush beats a full house and ace to nine is a straight
+    flush = [AceCard(Suit.Clubs)] + [NumberedCard(value, Suit.Clubs) for value in (6, 8, 9, 10)]
+    full_house = [KingCard(suit) for suit in (Suit.Hearts, Suit.Spades, Suit.Diamonds)] + \
+                 [QueenCard(Suit.Hearts), QueenCard(Suit.Spades)]
+    wheel = [AceCard(Suit.Hearts)] + [NumberedCard(value, Suit.Spades) for value in (6, 7, 8, 9)]
+    assert evaluate(flush) < evaluate(full_house)
+    assert evaluate(flush, short_deck=True) > evaluate(full_house, short_deck=True)
+    assert strength_type(evaluate(flush, short_deck=True), short_deck=True) == PokerHandType.flush
+    assert strength_type(evaluate(wheel)) == PokerHandType.high_card
+    assert strength_type(evaluate(wheel, short_deck=True), True) == PokerHandType.straight
+    strengths, types = evaluate_batch([[card.id for card in cards] for cards in (flush, full_house, wheel)], True)
+    assert list(types) == [PokerHandType.flush.value, PokerHandType.full_house.value, PokerHandType.straight.value]
+
+
+def test_hand_batch(tmp_path):
+    """Tests the columnar hand batch against PokerHand objects"""
+    card_ids = StandardDeck.shuffled_ids(500, seed=5)[:, :7]
+    batch = HandBatch.from_ids(card_ids)
+    assert len(batch) == 500 and batch.records.itemsize == 13
+
+    hand = batch[3]
+    assert hand == PokerHand([card_from_id(card_id) for card_id in card_ids[3]])
+    assert batch.card_ids(3) == sorted(card_ids[3])
+    assert np.shares_memory(batch[100:200].records, batch.records)
+
+    ordered = batch.sorted()
+    assert (np.diff(ordered.strength) >= 0).all()
+    groups = batch.group_by_type()
+    assert sum(len(group) for group in groups.values()) == len(batch)
+    assert {hand_type: len(group) for hand_type, group in groups.items()} == batch.type_counts()
+    assert all((group.hand_type == hand_type.value).all() for hand_type, group in groups.items())
+
+    again = HandBatch.from_poker_hands(batch[:10].poker_hands())
+    assert (again.records == batch.records[:10]).all()
+
+    batch.save(tmp_path / "hands.npy")
+    loaded = HandBatch.load(tmp_path / "hands.npy")
+    assert (loaded.records == batch.records).all()
+    assert len(HandBatch.concatenate([batch, loaded[::2]])) == 750
+
+
+def test_sort_keys():
+    """Tests that the integer sort keys give the same order as comparing cards, suits and hands"""
+    cards = list(CARDS)
+    assert sorted(cards[::-1], key=card_key) == sorted(cards[::-1]) == cards
+    assert [suit.key for suit in sorted(Suit)] == [0, 1, 2, 3]
+    assert sorted(PokerHandType) == sorted(PokerHandType, key=attrgetter("key"))
+    assert PokerHandType.flush > PokerHandType.straight and Suit.Spades > Suit.Hearts
+
+    hands = [PokerHand(list(row)) for row in np.array(CARDS)[StandardDeck.shuffled_ids(50, seed=2)[:, :7]]]
+    assert sorted(hands, key=hand_key) == sorted(hands)
+    assert max(hands, key=hand_key) == max(hands)
+
+    hand = Hand()
+    for card in cards[::-1]:
+        hand.add_card(card)
+    hand.sort()
+    assert hand.cards == cards
+
+
+def test_card_keywords():
+    """Tests that cards made with keyword arguments are the same interned cards"""
+    assert NumberedCard(value=4, suit=Suit.Hearts) is NumberedCard(4, Suit.Hearts)
+    assert NumberedCard(4, suit=Suit.Hearts) is NumberedCard(4, Suit.Hearts)
+    assert KingCard(suit=Suit.Clubs) is KingCard(Suit.Clubs)
+    assert NumberedCard(value=4, suit=Suit.Hearts).get_value() == 4
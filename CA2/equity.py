@@ -0,0 +1,287 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from itertools import chain, combinations, permutations
+import os
+import numpy as np
+
+from cardlib import evaluate_batch
+
+"""Equity calculations on top of cardlib: how often each player's hole cards win, given a partial board.
+Created by Rikard Radovac & Péter Gaal in the course DAT171 at Chalmers university of technology
+"""
+
+
+class EquityResult:
+    """Wins, ties and equity of every player over a number of boards
+
+    Args:
+        wins (array): Number of boards each player wins alone
+        ties (array): Number of boards each player shares the best hand on
+        equity (array): Share of the pot each player gets, summed over the boards
+        equity_squares (array): Sum of the squared share of each board, for the confidence intervals
+        boards (int): Number of boards
+    """
+
+    def __init__(self, wins, ties, equity, equity_squares, boards):
+        self.wins = np.asarray(wins)
+        self.ties = np.asarray(ties)
+        self.equity_sum = np.asarray(equity, dtype=float)
+        self.equity_squares = np.asarray(equity_squares, dtype=float)
+        self.boards = boards
+
+    @property
+    def win(self):
+        """array: Fraction of the boards each player wins alone"""
+        return self.wins / max(self.boards, 1)
+
+    @property
+    def tie(self):
+        """array: Fraction of the boards each player ties on"""
+        return self.ties / max(self.boards, 1)
+
+    @property
+    def losses(self):
+        """array: Number of boards each player loses"""
+        return self.boards - self.wins - self.ties
+
+    @property
+    def equity(self):
+        """array: Expected share of the pot for each player"""
+        return self.equity_sum / max(self.boards, 1)
+
+    def confidence_interval(self, z: float = 1.96):
+        """Returns the normal approximation confidence interval of each player's equity
+
+        Args:
+            z (float): Number of standard errors, 1.96 for 95 %
+
+        Returns:
+            (array, array): Lower and upper bounds
+        """
+        half_width = self.half_width(z)
+        return self.equity - half_width, self.equity + half_width
+
+    def half_width(self, z: float = 1.96):
+        """Returns the half width of the confidence interval of each player's equity
+
+        Args:
+            z (float): Number of standard errors, 1.96 for 95 %
+
+        Returns:
+            array: Half widths
+        """
+        if self.boards < 2:
+            return np.full(len(self.wins), np.inf)
+        variance = (self.equity_squares / self.boards - self.equity ** 2) * self.boards / (self.boards - 1)
+        return z * np.sqrt(np.maximum(variance, 0) / self.boards)
+
+    def copy(self):
+        """Returns a copy that shares no arrays with this result
+
+        Returns:
+            EquityResult: The copy
+        """
+        return EquityResult(self.wins.copy(), self.ties.copy(), self.equity_sum.copy(), self.equity_squares.copy(),
+                            self.boards)
+
+    def __add__(self, other):
+        return EquityResult(self.wins + other.wins, self.ties + other.ties, self.equity_sum + other.equity_sum,
+                            self.equity_squares + other.equity_squares, self.boards + other.boards)
+
+    def __str__(self):
+        lines = [f"Player {player + 1}: win {100 * win:.2f} %, tie {100 * tie:.2f} %, equity {100 * equity:.2f} %"
+                 for player, (win, tie, equity) in enumerate(zip(self.win, self.tie, self.equity))]
+        return "\n".join(lines + [f"over {self.boards} boards"])
+
+
+def card_ids(cards):
+    """Returns the ids of a list of cards or of the cards of a Hand
+
+    Args:
+        cards (list): The cards, a list or a Hand
+
+    Returns:
+        list: The card id of every card
+    """
+    return [card.id for card in getattr(cards, "cards", cards)]
+
+
+def _check_cards(hole_cards, board):
+    """Converts hole cards and board to id arrays and checks that they are a valid deal"""
+    hole_ids = np.array([card_ids(hole) for hole in hole_cards], dtype=np.int64)
+    board_ids = np.array(card_ids(board), dtype=np.int64)
+    if not 2 <= len(hole_ids) <= 10 or hole_ids.shape[1:] != (2,):
+        raise ValueError("Equity needs 2 to 10 players with two hole cards each")
+    if len(board_ids) > 5:
+        raise ValueError("The board has at most five cards")
+    dealt = np.concatenate((hole_ids.ravel(), board_ids))
+    if len(np.unique(dealt)) != len(dealt):
+        raise ValueError("A card can't be dealt twice")
+    return hole_ids, board_ids
+
+
+def score_boards(hole_ids, boards, weights=None):
+    """Ranks every player's hand on every board and counts the wins, ties and pot shares
+
+    Args:
+        hole_ids (array): (P, 2) card ids of each player's hole cards
+        boards (array): (B, 5) card ids of complete boards
+        weights (array): How many boards each row stands for, 1 for every row if None
+
+    Returns:
+        EquityResult: The result over the boards
+    """
+    players, boards_count = len(hole_ids), len(boards)
+    hands = np.concatenate((np.broadcast_to(hole_ids[:, None, :], (players, boards_count, 2)),
+                            np.broadcast_to(boards, (players, boards_count, 5))), axis=2)
+    strengths = evaluate_batch(hands.reshape(-1, 7))[0].reshape(players, boards_count)
+    best = strengths == strengths.max(axis=0)
+    winners = best.sum(axis=0)
+    share = best / winners
+    if weights is None:
+        weights = np.ones(boards_count, dtype=np.int64)
+    return EquityResult((best & (winners == 1)) @ weights, (best & (winners > 1)) @ weights, share @ weights,
+                        share ** 2 @ weights, int(weights.sum()))
+
+
+def _sample_boards(hole_ids, board_ids, samples, seed):
+    """Scores `samples` random completions of the board, used by the worker processes"""
+    rng = np.random.default_rng(seed)
+    remaining = np.setdiff1d(np.arange(52), np.concatenate((hole_ids.ravel(), board_ids)))
+    missing = 5 - len(board_ids)
+    drawn = np.argpartition(rng.random((samples, len(remaining))), missing, axis=1)[:, :missing] \
+        if missing else np.zeros((samples, 0), dtype=np.int64)
+    boards = np.concatenate((np.broadcast_to(board_ids, (samples, len(board_ids))), remaining[drawn]), axis=1)
+    return score_boards(hole_ids, boards)
+
+
+def monte_carlo_equity(hole_cards, board=(), precision=0.002, max_boards=2_000_000, batch_size=20000,
+                       processes=None, seed=None):
+    """Estimates each player's equity by sampling the rest of the board
+
+    The boards are sampled in vectorized batches spread over a process pool, every batch with its own
+    independent random stream. The batches are merged in order and sampling stops after the first batch
+    that makes every player's 95 % confidence interval narrower than +- precision, or at max_boards boards.
+    Batches sampled past that point are thrown away, so a seeded run gives the same result for any number
+    of processes.
+
+    Args:
+        hole_cards (list): Two cards (a list or a Hand) for each of 2 to 10 players
+        board (list): The 0 to 5 cards on the table
+        precision (float): Wanted half width of the confidence intervals
+        max_boards (int): Max number of boards to sample
+        batch_size (int): Boards per batch
+        processes (int): Number of worker processes, the number of CPUs if None, no pool if 1
+        seed (int): Seed for reproducible results
+
+    Returns:
+        EquityResult: Wins, ties and equity of every player
+    """
+    hole_ids, board_ids = _check_cards(hole_cards, board)
+    if len(board_ids) == 5:  # Nothing left to sample
+        return score_boards(hole_ids, board_ids[None, :])
+    processes = processes or os.cpu_count() or 1
+    streams = np.random.SeedSequence(seed)
+    result = EquityResult(np.zeros(len(hole_ids)), np.zeros(len(hole_ids)), np.zeros(len(hole_ids)),
+                          np.zeros(len(hole_ids)), 0)
+    pool = ProcessPoolExecutor(processes) if processes > 1 else None
+    try:
+        done = False
+        while not done and result.boards < max_boards:
+            remaining = max_boards - result.boards
+            sizes = [min(batch_size, remaining - start) for start in range(0, remaining, batch_size)][:processes]
+            seeds = streams.spawn(len(sizes))
+            if pool is None:
+                results = [_sample_boards(hole_ids, board_ids, sizes[0], seeds[0])]
+            else:
+                results = pool.map(_sample_boards, [hole_ids] * len(sizes), [board_ids] * len(sizes), sizes, seeds)
+            for batch_result in results:
+                result = result + batch_result
+                if result.half_width().max() <= precision:
+                    done = True
+                    break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return result
+
+
+_SUIT_PERMUTATIONS = np.array([[rank * 4 + suit for rank in range(13) for suit in permutation]
+                               for permutation in permutations(range(4))], dtype=np.int64)
+"""array: Card id -> card id under each of the 24 ways to relabel the suits"""
+
+EXACT_CHUNK = 200000
+"""int: Boards scored at a time by exact_equity, bounds the memory of a preflop enumeration"""
+
+exact_cache = OrderedDict()
+"""OrderedDict: Results of exact_equity by canonical deal, least recently used first"""
+
+EXACT_CACHE_SIZE = 4096
+"""int: Max number of deals kept in exact_cache"""
+
+
+def _canonical_deal(hole_ids, board_ids):
+    """Returns the same key for all deals that only differ by a relabelling of the suits"""
+    return min((tuple(tuple(sorted(permutation[hole])) for hole in hole_ids), tuple(sorted(permutation[board_ids])))
+               for permutation in _SUIT_PERMUTATIONS)
+
+
+def _board_classes(hole_ids, board_ids):
+    """Enumerates the completions of the board, one per class of suit isomorphic boards
+
+    Only suit relabellings that leave every player's hole cards and the board unchanged are used, so the boards
+    of a class give every player the same hand strength.
+
+    Returns:
+        (array, array): (B, 5) representative boards and how many boards each one stands for
+    """
+    dealt = [set(hole) for hole in hole_ids.tolist()] + [set(board_ids.tolist())]
+    symmetries = _SUIT_PERMUTATIONS[[all(set(permutation[list(cards)].tolist()) == cards for cards in dealt)
+                                     for permutation in _SUIT_PERMUTATIONS]]
+    remaining = np.setdiff1d(np.arange(52), np.concatenate((hole_ids.ravel(), board_ids)))
+    missing = 5 - len(board_ids)
+    draws = np.fromiter(chain.from_iterable(combinations(remaining.tolist(), missing)), dtype=np.int64)
+    draws = draws.reshape(-1, missing)
+
+    # Key every draw by its smallest image under the symmetries, the draws are sorted so the image only needs sorting
+    places = 52 ** np.arange(missing, dtype=np.int64)
+    keys = np.full(len(draws), np.iinfo(np.int64).max)
+    for permutation in symmetries:
+        np.minimum(keys, np.sort(permutation[draws], axis=1) @ places, out=keys)
+    keys, first, weights = np.unique(keys, return_index=True, return_counts=True)
+    boards = np.concatenate((np.broadcast_to(board_ids, (len(first), len(board_ids))), draws[first]), axis=1)
+    return boards, weights
+
+
+def exact_equity(hole_cards, board=(), use_cache=True):
+    """Calculates each player's exact equity by going through every completion of the board
+
+    Boards that only differ by a relabelling of suits the players can't tell apart are scored once and weighted.
+    Results are cached by the deal up to relabelling of the suits, in exact_cache. Every call returns its own
+    copy, so changing a result does not change later ones.
+
+    Args:
+        hole_cards (list): Two cards (a list or a Hand) for each of 2 to 10 players
+        board (list): The 0 to 5 cards on the table
+        use_cache (bool): Whether to look up and store the result in exact_cache
+
+    Returns:
+        EquityResult: Exact win, tie and loss counts of every player over all the remaining boards
+    """
+    hole_ids, board_ids = _check_cards(hole_cards, board)
+    key = _canonical_deal(hole_ids, board_ids) if use_cache else None
+    if key in exact_cache:
+        exact_cache.move_to_end(key)
+        return exact_cache[key].copy()
+
+    boards, weights = _board_classes(hole_ids, board_ids)
+    result = EquityResult(np.zeros(len(hole_ids), dtype=np.int64), np.zeros(len(hole_ids), dtype=np.int64),
+                          np.zeros(len(hole_ids)), np.zeros(len(hole_ids)), 0)
+    for start in range(0, len(boards), EXACT_CHUNK):
+        result = result + score_boards(hole_ids, boards[start:start + EXACT_CHUNK], weights[start:start + EXACT_CHUNK])
+
+    if use_cache:
+        exact_cache[key] = result.copy()
+        if len(exact_cache) > EXACT_CACHE_SIZE:
+            exact_cache.popitem(last=False)
+    return result
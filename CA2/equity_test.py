@@ -0,0 +1,82 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from cardlib import *
+from equity import *
+
+
+def test_monte_carlo_equity():
+    """Tests equity estimates against known results and the stopping rule"""
+    aces = [AceCard(Suit.Hearts), AceCard(Suit.Spades)]
+    kings = Hand()
+    kings.add_card(KingCard(Suit.Clubs))
+    kings.add_card(KingCard(Suit.Diamonds))
+
+    result = monte_carlo_equity([aces, kings], precision=0.005, seed=1, processes=1)
+    low, high = result.confidence_interval()
+    assert (high - low).max() <= 2 * 0.005
+    assert 0.79 < result.equity[0] < 0.84
+    assert result.equity.sum() == pytest.approx(1)
+    assert result.win[0] + result.win[1] + result.tie[0] == pytest.approx(1)
+
+    # The same seed gives the same boards with or without a process pool, whatever its size
+    for processes in (2, 4):
+        pooled = monte_carlo_equity([aces, kings], precision=0.005, seed=1, processes=processes)
+        assert pooled.boards == result.boards and (pooled.wins == result.wins).all()
+
+    # The last batch is cut to the boards left
+    capped = monte_carlo_equity([aces, kings], precision=0, max_boards=15000, batch_size=10000, seed=1, processes=2)
+    assert capped.boards == 15000
+
+    # On the river there is nothing to sample: the kings make a king-high club flush
+    board = [NumberedCard(value, Suit.Clubs) for value in (2, 3, 4, 7)] + [NumberedCard(9, Suit.Diamonds)]
+    river = monte_carlo_equity([aces, kings], board)
+    assert river.boards == 1 and list(river.win) == [0, 1]
+
+
+def test_equity_input():
+    """Tests that invalid deals are refused"""
+    aces = [AceCard(Suit.Hearts), AceCard(Suit.Spades)]
+    with pytest.raises(ValueError):
+        monte_carlo_equity([aces])
+    with pytest.raises(ValueError):
+        monte_carlo_equity([aces, [AceCard(Suit.Hearts), KingCard(Suit.Hearts)]])
+    with pytest.raises(ValueError):
+        monte_carlo_equity([aces, [KingCard(Suit.Clubs)]])
+
+
+def test_exact_equity():
+    """Tests exact enumeration against brute force and known preflop numbers"""
+    aces = [AceCard(Suit.Hearts), AceCard(Suit.Spades)]
+    kings = [KingCard(Suit.Clubs), KingCard(Suit.Diamonds)]
+    turn = [NumberedCard(2, Suit.Hearts), NumberedCard(7, Suit.Hearts), NumberedCard(9, Suit.Spades),
+            QueenCard(Suit.Hearts)]
+
+    # The suit isomorphism reduction has to count every board exactly once
+    hole_ids = np.array([[card.id for card in aces], [card.id for card in kings]])
+    for board in (turn, turn[:3]):
+        board_ids = np.array([card.id for card in board])
+        remaining = np.setdiff1d(np.arange(52), np.concatenate((hole_ids.ravel(), board_ids)))
+        boards = np.array([list(board_ids) + list(draw) for draw in combinations(remaining, 5 - len(board))])
+        brute_force = score_boards(hole_ids, boards)
+        result = exact_equity([aces, kings], board, use_cache=False)
+        assert result.boards == len(boards)
+        assert (result.wins == brute_force.wins).all() and (result.ties == brute_force.ties).all()
+        assert (result.losses == brute_force.losses).all()
+
+    # Heads up preflop, hit through the cache for the same deal with the suits relabelled
+    exact_cache.clear()
+    result = exact_equity([aces, kings])
+    assert list(result.wins) == [1388072, 317694] and list(result.ties) == [6538, 6538]
+    swapped = exact_equity([[AceCard(Suit.Clubs), AceCard(Suit.Diamonds)],
+                            [KingCard(Suit.Hearts), KingCard(Suit.Spades)]])
+    assert swapped is not result and len(exact_cache) == 1
+    assert (swapped.wins == result.wins).all() and swapped.equity_sum.tolist() == result.equity_sum.tolist()
+
+    # Changing a returned result leaves the cached one alone
+    swapped.wins[0] = 0
+    swapped.equity_sum += 1
+    again = exact_equity([aces, kings])
+    assert list(again.wins) == [1388072, 317694] and (again.equity_sum == result.equity_sum).all()
@@ -0,0 +1,219 @@
+import sys
+import time
+import numpy as np
+
+from cardlib import evaluate_batch
+from equity import card_ids
+
+"""Precomputed preflop equities of the 169 starting hand classes, stored in a memory-mapped table.
+Created by Rikard Radovac & Péter Gaal in the course DAT171 at Chalmers university of technology
+"""
+
+RANKS = "AKQJT98765432"
+"""str: Rank letters from the highest to the lowest, the rows and columns of the class grid"""
+
+CLASSES = 169
+"""int: Number of starting hand classes: 13 pairs, 78 suited and 78 offsuit hands"""
+
+MAX_OPPONENTS = 9
+"""int: Largest number of random opponents in the table"""
+
+PREFLOP_MAGIC = b"CA2PRE01"
+"""bytes: First bytes of a preflop table file"""
+
+PREFLOP_HEADER = np.dtype([("magic", "S8"), ("samples", "<u4"), ("opponents", "<u4")])
+"""dtype: Header of a preflop table file, followed by the float32 matchup and versus random tables"""
+
+
+def hand_class(cards):
+    """Returns the starting hand class of two hole cards
+
+    The classes are laid out on a 13 x 13 grid with the ranks from ace to two: pairs on the diagonal, suited hands
+    above it and offsuit hands below it.
+
+    Args:
+        cards (list): Two cards, a list or a Hand
+
+    Returns:
+        int: Row * 13 + column of the class
+    """
+    return _class_of(*card_ids(cards))
+
+
+def _class_of(first, second):
+    """Returns the class of two card ids"""
+    high, low = sorted((12 - (first >> 2), 12 - (second >> 2)))
+    return high * 13 + low if (first & 3) == (second & 3) else low * 13 + high
+
+
+def class_name(index):
+    """Returns the usual name of a starting hand class, like 'AA', 'AKs' or 'T9o'
+
+    Args:
+        index (int): The class, as returned by hand_class
+
+    Returns:
+        str: The name
+    """
+    row, column = divmod(index, 13)
+    if row == column:
+        return RANKS[row] * 2
+    return RANKS[min(row, column)] + RANKS[max(row, column)] + ("s" if row < column else "o")
+
+
+def class_combos():
+    """Returns the card ids of every combo of each starting hand class
+
+    Returns:
+        (array, array): (169, 12, 2) card ids of the combos of each class, padded with zeros, and the number of
+        combos of each class, 6 for pairs, 4 for suited and 12 for offsuit hands
+    """
+    combos = [[] for _ in range(CLASSES)]
+    for first in range(52):
+        for second in range(first + 1, 52):
+            combos[_class_of(first, second)].append((first, second))
+    padded = np.zeros((CLASSES, 12, 2), dtype=np.int64)
+    for index, members in enumerate(combos):
+        padded[index, :len(members)] = members
+    return padded, np.array([len(members) for members in combos])
+
+
+def _sample_combos(classes, combos, counts, rng):
+    """Picks a random combo of each of the given classes"""
+    picks = (rng.random(len(classes)) * counts[classes]).astype(np.int64)
+    return combos[classes, picks]
+
+
+def _deal_rest(dealt, count, rng):
+    """Deals count random cards to every row that are not among the row's dealt cards"""
+    keys = rng.random((len(dealt), 52))
+    np.put_along_axis(keys, dealt, 2.0, axis=1)
+    return np.argpartition(keys, count, axis=1)[:, :count]
+
+
+def _showdown(holes, boards):
+    """Returns the pot share of every player, (N, P) shares for (N, P, 2) hole cards and (N, 5) boards"""
+    rows, players = holes.shape[:2]
+    hands = np.concatenate((holes, np.broadcast_to(boards[:, None, :], (rows, players, 5))), axis=2)
+    strengths = evaluate_batch(hands.reshape(-1, 7))[0].reshape(rows, players)
+    best = strengths == strengths.max(axis=1, keepdims=True)
+    return best / best.sum(axis=1, keepdims=True)
+
+
+def _matchup_equity(first, second, samples, combos, counts, rng):
+    """Estimates the equity of each class in first against the class in second with samples deals per pair"""
+    first, second = np.repeat(first, samples), np.repeat(second, samples)
+    hero = _sample_combos(first, combos, counts, rng)
+    villain = _sample_combos(second, combos, counts, rng)
+    clash = (hero[:, :, None] == villain[:, None, :]).any(axis=(1, 2))
+    while clash.any():  # Redraw the villain combos that share a card with the hero
+        villain[clash] = _sample_combos(second[clash], combos, counts, rng)
+        clash = (hero[:, :, None] == villain[:, None, :]).any(axis=(1, 2))
+    holes = np.stack((hero, villain), axis=1)
+    boards = _deal_rest(holes.reshape(-1, 4), 5, rng)
+    return _showdown(holes, boards)[:, 0].reshape(-1, samples).mean(axis=1)
+
+
+def _random_equity(classes, opponents, samples, combos, counts, rng):
+    """Estimates the equity of each class against a number of random hands with samples deals per class"""
+    classes = np.repeat(classes, samples)
+    hero = _sample_combos(classes, combos, counts, rng)
+    rest = _deal_rest(hero, 2 * opponents + 5, rng)
+    holes = np.concatenate((hero[:, None, :], rest[:, :2 * opponents].reshape(-1, opponents, 2)), axis=1)
+    return _showdown(holes, rest[:, 2 * opponents:])[:, 0].reshape(-1, samples).mean(axis=1)
+
+
+def build_preflop_table(filename, samples=10000, seed=None, chunk=100000):
+    """Computes the preflop equity tables with the cardlib evaluator and writes them to a binary file
+
+    Every class pair and every class against 1 to MAX_OPPONENTS random hands is sampled with samples deals. Equal
+    classes have exactly 50 % against each other, and the matchup table is filled in from the pairs above the
+    diagonal so that matchup[a, b] + matchup[b, a] == 1.
+
+    Args:
+        filename (str): The file to write
+        samples (int): Deals per class pair and per class and number of opponents
+        seed (int): Seed for reproducible tables
+        chunk (int): Max number of deals evaluated at a time
+    """
+    rng = np.random.default_rng(seed)
+    combos, counts = class_combos()
+    start_time = time.time()
+
+    matchup = np.full((CLASSES, CLASSES), 0.5, dtype=np.float32)
+    first, second = np.triu_indices(CLASSES, 1)
+    pairs = max(chunk // samples, 1)
+    for start in range(0, len(first), pairs):
+        equity = _matchup_equity(first[start:start + pairs], second[start:start + pairs], samples, combos, counts, rng)
+        matchup[first[start:start + pairs], second[start:start + pairs]] = equity
+        matchup[second[start:start + pairs], first[start:start + pairs]] = 1 - equity
+    print(f"Sampled {len(first)} class pairs in {time.time() - start_time:.1f} seconds")
+
+    versus_random = np.zeros((CLASSES, MAX_OPPONENTS), dtype=np.float32)
+    for opponents in range(1, MAX_OPPONENTS + 1):
+        classes = np.arange(CLASSES)
+        rows = max(chunk // (samples * (opponents + 1)), 1)
+        for start in range(0, CLASSES, rows):
+            versus_random[start:start + rows, opponents - 1] = _random_equity(classes[start:start + rows], opponents,
+                                                                              samples, combos, counts, rng)
+    print(f"Sampled all classes against random hands in {time.time() - start_time:.1f} seconds")
+
+    header = np.array([(PREFLOP_MAGIC, samples, MAX_OPPONENTS)], dtype=PREFLOP_HEADER)
+    with open(filename, "wb") as output:
+        output.write(header.tobytes())
+        output.write(matchup.tobytes())
+        output.write(versus_random.tobytes())
+
+
+class PreflopTable:
+    """Preflop equities read from a file written by build_preflop_table
+
+    The tables are memory-mapped, so opening the file is instant and only the looked up entries are read.
+
+    Args:
+        filename (str): The table file
+    """
+
+    def __init__(self, filename):
+        header = np.fromfile(filename, dtype=PREFLOP_HEADER, count=1)
+        if len(header) == 0 or header["magic"][0] != PREFLOP_MAGIC:
+            raise ValueError(f"{filename} is not a preflop table")
+        self.samples = int(header["samples"][0])
+        self.max_opponents = int(header["opponents"][0])
+        self.matchup = np.memmap(filename, dtype="<f4", mode="r", offset=PREFLOP_HEADER.itemsize,
+                                 shape=(CLASSES, CLASSES))
+        self.versus_random = np.memmap(filename, dtype="<f4", mode="r",
+                                       offset=PREFLOP_HEADER.itemsize + self.matchup.nbytes,
+                                       shape=(CLASSES, self.max_opponents))
+
+    def equity(self, hole_cards, other):
+        """Returns the preflop equity of a hand against another hand
+
+        Args:
+            hole_cards (list): Two cards, a list or a Hand
+            other (list): The opponent's two cards
+
+        Returns:
+            float: Expected share of the pot
+        """
+        return float(self.matchup[hand_class(hole_cards), hand_class(other)])
+
+    def equity_vs_random(self, hole_cards, opponents=1):
+        """Returns the preflop equity of a hand against a number of random hands
+
+        Args:
+            hole_cards (list): Two cards, a list or a Hand
+            opponents (int): Number of opponents, 1 to max_opponents
+
+        Returns:
+            float: Expected share of the pot
+        """
+        if not 1 <= opponents <= self.max_opponents:
+            raise ValueError(f"The table has 1 to {self.max_opponents} opponents")
+        return float(self.versus_random[hand_class(hole_cards), opponents - 1])
+
+
+if __name__ == "__main__":
+    # python preflop.py [filename] [samples]
+    build_preflop_table(sys.argv[1] if len(sys.argv) > 1 else "preflop.bin",
+                        int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
@@ -0,0 +1,35 @@
+import pytest
+
+from cardlib import *
+from preflop import *
+
+
+def test_hand_class():
+    """Tests the 169 starting hand classes"""
+    assert class_name(hand_class([AceCard(Suit.Hearts), AceCard(Suit.Spades)])) == "AA"
+    assert class_name(hand_class([KingCard(Suit.Hearts), AceCard(Suit.Hearts)])) == "AKs"
+    assert class_name(hand_class([NumberedCard(9, Suit.Clubs), NumberedCard(10, Suit.Hearts)])) == "T9o"
+    names = {class_name(index) for index in range(CLASSES)}
+    assert len(names) == CLASSES and "32o" in names and "32s" in names
+
+
+def test_preflop_table(tmp_path):
+    """Tests building and memory-mapping a small preflop table"""
+    filename = tmp_path / "preflop.bin"
+    build_preflop_table(filename, samples=20, seed=1)
+    table = PreflopTable(filename)
+    assert table.samples == 20 and table.max_opponents == MAX_OPPONENTS
+
+    aces = [AceCard(Suit.Hearts), AceCard(Suit.Spades)]
+    hand = Hand()
+    hand.add_card(KingCard(Suit.Clubs))
+    hand.add_card(KingCard(Suit.Diamonds))
+    assert table.equity(aces, hand) + table.equity(hand, aces) == pytest.approx(1)
+    assert table.equity(aces, [AceCard(Suit.Clubs), AceCard(Suit.Diamonds)]) == 0.5
+    assert 0 <= table.equity_vs_random(aces, 9) <= 1
+    with pytest.raises(ValueError):
+        table.equity_vs_random(aces, 10)
+
+    filename.write_bytes(b"not a table")
+    with pytest.raises(ValueError):
+        PreflopTable(filename)
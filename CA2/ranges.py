@@ -0,0 +1,199 @@
+from itertools import chain, combinations
+import numpy as np
+
+from cardlib import evaluate_batch
+from equity import card_ids
+from preflop import RANKS, class_combos
+
+"""Hand ranges like 'AKs, QQ+, 76s' and the equity of one range against another.
+Created by Rikard Radovac & Péter Gaal in the course DAT171 at Chalmers university of technology
+"""
+
+SUIT_LETTERS = "hscd"
+"""str: Suit letters in card id order: hearts, spades, clubs and diamonds"""
+
+ENUMERATE_MISSING = 2
+"""int: Range equity enumerates every board when at most this many board cards are missing, and samples otherwise"""
+
+RANGE_CHUNK = 2000000
+"""int: Max number of combo pairs times boards compared at a time"""
+
+
+def _grid_class(first, second, shape):
+    """Returns the class of two rank indexes (0 for aces) with shape '' for pairs, 's' for suited or 'o' for offsuit"""
+    high, low = min(first, second), max(first, second)
+    return high * 13 + low if shape == "s" else low * 13 + high
+
+
+def _parse_hand(token):
+    """Splits a hand like 'AKs' or 'QQ' into two rank indexes and the shapes it stands for"""
+    if len(token) not in (2, 3) or token[0] not in RANKS or token[1] not in RANKS or token[2:] not in ("", "s", "o"):
+        raise ValueError(f"Unknown hand '{token}'")
+    first, second = RANKS.index(token[0]), RANKS.index(token[1])
+    if first == second:
+        if token[2:]:
+            raise ValueError(f"A pair can't be suited or offsuit: '{token}'")
+        return first, second, ("",)
+    if first > second:
+        raise ValueError(f"Write the highest rank first: '{token}'")
+    return first, second, (token[2],) if token[2:] else ("s", "o")
+
+
+def _parse_token(token):
+    """Returns the class indexes of one range token, like 'AKs', 'QQ+', 'A2s+', '22-55' or 'A2s-A5s'"""
+    if token.endswith("+"):
+        first, second, shapes = _parse_hand(token[:-1])
+        if first == second:
+            rank_pairs = [(rank, rank) for rank in range(first + 1)]
+        else:
+            rank_pairs = [(first, rank) for rank in range(first + 1, second + 1)]
+    elif "-" in token:
+        start, _, end = token.partition("-")
+        first, second, shapes = _parse_hand(start)
+        end_first, end_second, end_shapes = _parse_hand(end)
+        if first == second and end_first == end_second:
+            rank_pairs = [(rank, rank) for rank in range(min(first, end_first), max(first, end_first) + 1)]
+        elif first == end_first and first != second and shapes == end_shapes:
+            rank_pairs = [(first, rank) for rank in range(min(second, end_second), max(second, end_second) + 1)]
+        else:
+            raise ValueError(f"A span has to be between two pairs or keep the first rank and the shape: '{token}'")
+    else:
+        first, second, shapes = _parse_hand(token)
+        rank_pairs = [(first, second)]
+    return [_grid_class(first, second, "" if first == second else shape)
+            for first, second in rank_pairs for shape in shapes]
+
+
+def parse_range(text):
+    """Parses a hand range into the card ids of all its combos
+
+    The range is a comma separated list of hands: 'AA', 'AKs' (suited), 'AKo' (offsuit), 'AK' (both), 'QQ+' (queens
+    or better), 'ATs+' (ace ten suited up to ace king suited), '22-55', 'A2s-A5s', or exact cards like 'AhKh'.
+
+    Args:
+        text (str): The range
+
+    Returns:
+        array: (N, 2) card ids of every combo in the range, each combo once
+    """
+    combos, counts = class_combos()
+    picked = []
+    for token in filter(None, (token.strip() for token in text.split(","))):
+        if len(token) == 4 and token[1] in SUIT_LETTERS and token[3] in SUIT_LETTERS:
+            if token[0] not in RANKS or token[2] not in RANKS or token[:2] == token[2:]:
+                raise ValueError(f"Unknown combo '{token}'")
+            picked.append(sorted((12 - RANKS.index(card[0])) * 4 + SUIT_LETTERS.index(card[1])
+                                 for card in (token[:2], token[2:])))
+        else:
+            picked.extend(combo for index in _parse_token(token) for combo in combos[index, :counts[index]].tolist())
+    if not picked:
+        raise ValueError("The range is empty")
+    return np.unique(np.array(picked, dtype=np.int64), axis=0)
+
+
+class RangeEquity:
+    """Equity of every combo of one range against every combo of another
+
+    Args:
+        combos (array): (N, 2) card ids of the first range's combos
+        other_combos (array): (M, 2) card ids of the second range's combos
+        shares (array): (N, M) pot share of the first combo, summed over the boards
+        boards (array): (N, M) number of boards each pair of combos was played on, 0 for blocked pairs
+    """
+
+    def __init__(self, combos, other_combos, shares, boards):
+        self.combos = combos
+        self.other_combos = other_combos
+        self.shares = shares
+        self.boards = boards
+
+    @property
+    def matrix(self):
+        """array: (N, M) equity of each combo of the first range against each combo of the second, nan if blocked"""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.boards > 0, self.shares / np.maximum(self.boards, 1), np.nan)
+
+    @property
+    def equity(self):
+        """float: Equity of the first range, every pair of combos that can be dealt together equally likely"""
+        return float(np.nanmean(self.matrix))
+
+    @property
+    def other_equity(self):
+        """float: Equity of the second range"""
+        return 1 - self.equity
+
+    def combo_equity(self):
+        """Returns the equity of each combo of the first range against the whole second range
+
+        Returns:
+            array: (N,) equities, nan for combos that are blocked by every combo of the second range
+        """
+        with np.errstate(invalid="ignore"):
+            return np.nanmean(self.matrix, axis=1)
+
+    def __str__(self):
+        return f"Range 1: {100 * self.equity:.2f} %, range 2: {100 * self.other_equity:.2f} %"
+
+
+def _range_boards(board_ids, samples, rng):
+    """Returns every completion of the board, or samples random ones when too many cards are missing"""
+    remaining = np.setdiff1d(np.arange(52), board_ids)
+    missing = 5 - len(board_ids)
+    if missing <= ENUMERATE_MISSING:
+        draws = np.fromiter(chain.from_iterable(combinations(remaining.tolist(), missing)), dtype=np.int64)
+        draws = draws.reshape(-1, missing)
+    else:
+        draws = remaining[np.argpartition(rng.random((samples, len(remaining))), missing, axis=1)[:, :missing]]
+    return np.concatenate((np.broadcast_to(board_ids, (len(draws), len(board_ids))), draws), axis=1)
+
+
+def range_equity(first_range, second_range, board=(), samples=5000, seed=None):
+    """Calculates the equity of one hand range against another
+
+    Combos blocked by the board are removed. Every combo of both ranges is evaluated once per board, and the
+    strengths are then compared for all pairs of combos at once. A pair of combos only counts the boards that
+    share no card with it, and pairs that share a card are left out. On the turn and the flop every board is
+    played, before the flop samples random boards are.
+
+    Args:
+        first_range (str or array): A range like 'AKs, QQ+' or (N, 2) card ids as returned by parse_range
+        second_range (str or array): The other range
+        board (list): The 0 to 5 cards on the table
+        samples (int): Number of boards to sample before the flop
+        seed (int): Seed for reproducible results
+
+    Returns:
+        RangeEquity: The equity matrix and aggregates
+    """
+    board_ids = np.array(card_ids(board), dtype=np.int64)
+    if len(board_ids) > 5 or len(np.unique(board_ids)) != len(board_ids):
+        raise ValueError("The board has at most five different cards")
+    ranges = []
+    for hand_range in (first_range, second_range):
+        combos = parse_range(hand_range) if isinstance(hand_range, str) else np.asarray(hand_range, dtype=np.int64)
+        combos = combos[~np.isin(combos, board_ids).any(axis=1)]
+        if len(combos) == 0:
+            raise ValueError("Every combo of a range is blocked by the board")
+        ranges.append(combos)
+    combos, other_combos = ranges
+    every_combo = np.concatenate(ranges)
+
+    boards = _range_boards(board_ids, samples, np.random.default_rng(seed))
+    pair_free = ~(combos[:, None, :, None] == other_combos[None, :, None, :]).any(axis=(2, 3))
+    shares = np.zeros((len(combos), len(other_combos)))
+    counts = np.zeros((len(combos), len(other_combos)), dtype=np.int64)
+    step = max(RANGE_CHUNK // (len(combos) * len(other_combos)), 1)
+    for start in range(0, len(boards), step):
+        chunk = boards[start:start + step]
+        hands = np.concatenate((np.broadcast_to(every_combo[None, :, :], (len(chunk), len(every_combo), 2)),
+                                np.broadcast_to(chunk[:, None, :], (len(chunk), len(every_combo), 5))), axis=2)
+        strengths = evaluate_batch(hands.reshape(-1, 7))[0].reshape(len(chunk), len(every_combo))
+        free = ~(every_combo[None, :, :, None] == chunk[:, None, None, :]).any(axis=(2, 3))
+
+        first, second = strengths[:, :len(combos)], strengths[:, len(combos):]
+        valid = free[:, :len(combos), None] & free[:, None, len(combos):] & pair_free
+        share = (first[:, :, None] > second[:, None, :]) + 0.5 * (first[:, :, None] == second[:, None, :])
+        shares += (share * valid).sum(axis=0)
+        counts += valid.sum(axis=0)
+    return RangeEquity(combos, other_combos, shares, counts)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from cardlib import *
+from equity import exact_equity
+from ranges import *
+
+
+def test_parse_range():
+    """Tests the range syntax"""
+    assert len(parse_range("AA")) == 6 and len(parse_range("AKs")) == 4 and len(parse_range("AKo")) == 12
+    assert len(parse_range("AK")) == 16 and len(parse_range("QQ+")) == 18 and len(parse_range("A2s+")) == 48
+    assert len(parse_range("22-55")) == 24 and len(parse_range("A5s-A2s")) == 16
+    assert len(parse_range("AKs, QQ+, 76s")) == 26 and len(parse_range("AA, AA, AhAs")) == 6
+    ace_king = parse_range("AhKh")
+    assert [card_from_id(card_id) for card_id in ace_king[0]] == [KingCard(Suit.Hearts), AceCard(Suit.Hearts)]
+    for bad in ("", "AKx", "KA", "AAs", "22-AKs", "AhAh", "XhKh"):
+        with pytest.raises(ValueError):
+            parse_range(bad)
+
+
+def test_range_equity():
+    """Tests range against range equity against exact single hand results"""
+    aces = [AceCard(Suit.Hearts), AceCard(Suit.Spades)]
+    kings = [KingCard(Suit.Clubs), KingCard(Suit.Diamonds)]
+    turn = [NumberedCard(2, Suit.Clubs), NumberedCard(7, Suit.Hearts), NumberedCard(9, Suit.Spades),
+            QueenCard(Suit.Diamonds)]
+
+    # A single combo each is the exact equity
+    result = range_equity("AhAs", "KcKd", turn)
+    assert result.matrix[0, 0] == pytest.approx(exact_equity([aces, kings], turn).equity[0])
+
+    # Every entry of the matrix is the exact equity of its two combos, blocked pairs are nan
+    result = range_equity("AA, KK", "AK", turn[:3])
+    matrix = result.matrix
+    assert matrix.shape == (12, 16)
+    for row, combo in enumerate(result.combos):
+        for column, other in enumerate(result.other_combos):
+            if set(combo) & set(other):
+                assert np.isnan(matrix[row, column])
+            elif (row + column) % 17 == 0:
+                exact = exact_equity([[card_from_id(card_id) for card_id in combo],
+                                      [card_from_id(card_id) for card_id in other]], turn[:3], use_cache=False)
+                assert matrix[row, column] == pytest.approx(exact.equity[0])
+    assert result.equity + result.other_equity == pytest.approx(1)
+    assert len(result.combo_equity()) == 12
+
+    # Combos blocked by the board are removed
+    assert len(range_equity("QQ", "AA", turn).combos) == 3
+    with pytest.raises(ValueError):
+        range_equity("QdQh", "AA", turn)
+
+    preflop = range_equity("AA", "KK", samples=20000, seed=1)
+    assert 0.80 < preflop.equity < 0.84
@@ -1,7 +1,10 @@
 from enum import Enum
 from abc import ABC, abstractmethod
-import random
-from collections import Counter
+from inspect import signature
+from operator import attrgetter
+from collections import Counter, OrderedDict
+from itertools import combinations
+import numpy as np
 
 """Card library with a standard deck, standard cards and a hand which holds the cards and is able to find
 the best poker hand.
@@ -18,6 +21,9 @@ class Suit(Enum):
     Clubs = 3
     Diamonds = 4
 
+    def __init__(self, value):
+        self.key = value - 1  #: Integer sort key, the suit part of a card id
+
     def __str__(self):
         """Returns the suit unicode symbol
         """
@@ -31,18 +37,47 @@ class Suit(Enum):
             return "♦"
 
     def __lt__(self, other):
-        return self.value < other.value
+        return self.key < other.key
 
     def __eq__(self, other):
-        return self.value == other.value
+        return self.key == other.key
+
+    def __hash__(self):
+        return self.key
 
 
 class PlayingCard(ABC):
     """Base class defining values and suits and passing on the methods to its children.
+
+    Cards are immutable and interned: creating a card that already exists returns the existing object, so a
+    deck is only a list of references. Every card has a compact integer id from 0 to 51, see card_from_id.
     """
+    __slots__ = ("suit", "id")
+    _interned = {}
+
+    def __new__(cls, *args, **kwargs):
+        if kwargs:  # Key keyword calls like positional ones, so NumberedCard(value=4, suit=s) is NumberedCard(4, s)
+            args = signature(cls.__init__).bind(None, *args, **kwargs).args[1:]
+        card = PlayingCard._interned.get((cls, args))
+        if card is None:
+            card = PlayingCard._interned[(cls, args)] = super().__new__(cls)
+        return card
 
     def __init__(self, suit: Suit):
-        self.suit = suit
+        object.__setattr__(self, "suit", suit)
+        object.__setattr__(self, "id", (self.get_value() - 2) * 4 + suit.value - 1)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Cards are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Cards are immutable")
+
+    def __reduce__(self):
+        return type(self), (self.suit,)
+
+    def __hash__(self):
+        return self.id
 
     @abstractmethod
     def get_value(self):
@@ -71,7 +106,7 @@ class PlayingCard(ABC):
         Returns:
             int, Suit: returns the smaller value
         """
-        return (self.get_value(), self.suit) < (other.get_value(), other.suit)
+        return self.id < other.id  # Ids are ordered by value, then suit
 
     def __eq__(self, other):
         """Defines the equal comparing between cards
@@ -82,16 +117,20 @@ class PlayingCard(ABC):
         Returns:
             int, Suit: equal value
         """
-        return (self.get_value(), self.suit) == (other.get_value(), other.suit)
+        return self.id == other.id
 
 
 class NumberedCard(PlayingCard):
     """Class representing the Numbered cards. Subclass of PlayingCard
     """
+    __slots__ = ("value",)
 
     def __init__(self, value: int, suit: Suit):
+        object.__setattr__(self, "value", value)
         super().__init__(suit)
-        self.value = value
+
+    def __reduce__(self):
+        return NumberedCard, (self.value, self.suit)
 
     def get_value(self):
         """Returns the cards value
@@ -116,6 +155,7 @@ class NumberedCard(PlayingCard):
 class JackCard(PlayingCard):
     """Class representing the Jack cards. Subclass of PlayingCard
     """
+    __slots__ = ()
 
     def get_value(self):
         """Returns the cards value
@@ -140,6 +180,7 @@ class JackCard(PlayingCard):
 class QueenCard(PlayingCard):
     """Class representing the Queen cards. Subclass of PlayingCard
     """
+    __slots__ = ()
 
     def get_value(self):
         """Returns the cards value
@@ -164,6 +205,7 @@ class QueenCard(PlayingCard):
 class KingCard(PlayingCard):
     """Class representing the King cards. Subclass of PlayingCard
     """
+    __slots__ = ()
 
     def get_value(self):
         """Returns the cards value
@@ -188,6 +230,7 @@ class KingCard(PlayingCard):
 class AceCard(PlayingCard):
     """Class representing the Ace cards. Subclass of PlayingCard
     """
+    __slots__ = ()
 
     def get_value(self):
         """Returns the cards value
@@ -209,6 +252,40 @@ class AceCard(PlayingCard):
         return f"Ace {self.suit}"
 
 
+def make_card(value: int, suit: Suit):
+    """Returns the card with the given value and suit
+
+    Args:
+        value (int): Card value from 2 to 14 (ace)
+        suit (Suit): Card suit
+
+    Returns:
+        PlayingCard: The interned card
+    """
+    face_cards = {11: JackCard, 12: QueenCard, 13: KingCard, 14: AceCard}
+    if value in face_cards:
+        return face_cards[value](suit)
+    return NumberedCard(value, suit)
+
+
+CARDS = [make_card(value, suit) for value in range(2, 15) for suit in Suit]  #: All 52 cards, indexed by id
+
+
+card_key = attrgetter("id")  #: Sort key function for cards, e.g. cards.sort(key=card_key)
+
+
+def card_from_id(card_id: int):
+    """Returns the card with the given id
+
+    Args:
+        card_id (int): Id from 0 to 51
+
+    Returns:
+        PlayingCard: The interned card
+    """
+    return CARDS[card_id]
+
+
 class Hand:
     """Hand class describing the current cards in the hand with methods to add, draw, sort and calculate the
     best poker hand
@@ -237,7 +314,7 @@ class Hand:
     def sort(self):
         """Sorts the hand in ascending order
         """
-        self.cards.sort()
+        self.cards.sort(key=card_key)
 
     def best_poker_hand(self, cards: list[PlayingCard] = []):
         """Checks the current best possible poker hand
@@ -250,7 +327,18 @@ class Hand:
         """
 
         total_cards = self.cards + cards
-        return PokerHand(total_cards)
+        return PokerHand(total_cards, evaluation_cache.strength(total_cards))
+
+    def outs(self, cards: list[PlayingCard] = []):
+        """Finds the unseen cards that improve the hand type, with one vectorized evaluation of all of them
+
+        Args:
+            cards (list): List of cards on the table, the flop or the turn
+
+        Returns:
+            Outs: The improving cards and the chances to improve
+        """
+        return Outs(self.cards + cards)
 
     def __str__(self):
         return f"Current cards in hand: {self.cards}"
@@ -283,6 +371,9 @@ class PokerHandType(Enum):
     one_pair = 2
     high_card = 1
 
+    def __init__(self, value):
+        self.key = value  #: Integer sort key
+
     def __lt__(self, other):
         """Defines the "less than" comparing between values
 
@@ -292,7 +383,7 @@ class PokerHandType(Enum):
         Returns:
             int: returns the smaller value
         """
-        return self.value < other.value
+        return self.key < other.key
 
     def __eq__(self, other):
         """Defines the "equal" comparing between values
@@ -303,7 +394,10 @@ class PokerHandType(Enum):
         Returns:
             int: returns the equal value
         """
-        return self.value == other.value
+        return self.key == other.key
+
+    def __hash__(self):
+        return self.key
 
     def __str__(self):
         """Returns a readable poker hand type
@@ -328,25 +422,533 @@ class PokerHandType(Enum):
             return "High card"
 
 
+# Hand strengths are integers: the PokerHandType value from bit 20 and up, followed by the card values that
+# decide between hands of that type, four bits each with the most significant first. Comparing strengths
+# compares hands. Ranks below are card values minus two (0-12), suits are Suit values minus one (0-3).
+_TYPE_SHIFT = 20
+
+
+def _top_values(rank_mask: int):
+    """Returns the (up to) five highest card values in a rank bitmask, packed four bits each"""
+    values = 0
+    count = 0
+    for rank in range(12, -1, -1):
+        if rank_mask >> rank & 1 and count < 5:
+            values = values << 4 | rank + 2
+            count += 1
+    return values << 4 * (5 - count)
+
+
+def _straight_high(rank_mask: int):
+    """Returns the value of the highest card of the best straight in a rank bitmask, 0 if there is none"""
+    for rank in range(12, 3, -1):
+        window = 0b11111 << rank - 4
+        if rank_mask & window == window:
+            return rank + 2
+    wheel = 0b1000000001111  # Ace, 2, 3, 4, 5
+    return 5 if rank_mask & wheel == wheel else 0
+
+
+_TOP_VALUES = [_top_values(rank_mask) for rank_mask in range(1 << 13)]
+_STRAIGHT_HIGH = [_straight_high(rank_mask) for rank_mask in range(1 << 13)]
+_COUNT_UNIT = [1 << 3 * (card_id >> 2) for card_id in range(52)]  # Rank counts are packed three bits each
+_RANK_TABLE = {}  # Strength of the non-flush part of a hand, by packed rank counts. Filled on first use.
+
+# Short deck (six plus) hold'em has no 2 to 5, counts ace to nine as the lowest straight and ranks a flush above
+# a full house. Short deck strengths swap the type values of the flush and the full house so they still compare.
+_SHORT_DECK_WHEEL = 1 << 12 | 0b1111 << 4  # Ace, 6, 7, 8, 9
+_SHORT_DECK_STRAIGHT_HIGH = [high or (9 if rank_mask & _SHORT_DECK_WHEEL == _SHORT_DECK_WHEEL else 0)
+                             for rank_mask, high in enumerate(_STRAIGHT_HIGH)]
+_SHORT_DECK_RANK_TABLE = {}
+_SHORT_DECK_ORDER = {6: 7, 7: 6}  # Flush <-> full house
+
+
+def _type_value(hand_type, short_deck: bool = False):
+    """Returns the value a hand type has in the strengths of the standard or the short deck ranking"""
+    return _SHORT_DECK_ORDER.get(hand_type.value, hand_type.value) if short_deck else hand_type.value
+
+
+def _rank_strength(count_key: int, short_deck: bool = False):
+    """Returns the best strength that can be made from packed rank counts, without flushes
+
+    Args:
+        count_key (int): The count of every rank, three bits each
+        short_deck (bool): Whether to use the short deck ranking
+
+    Returns:
+        int: Hand strength
+    """
+    straight_high = _SHORT_DECK_STRAIGHT_HIGH if short_deck else _STRAIGHT_HIGH
+    counts = [count_key >> 3 * rank & 7 for rank in range(13)]
+    rank_mask = sum(1 << rank for rank in range(13) if counts[rank])
+    fours = [rank for rank in range(12, -1, -1) if counts[rank] >= 4]
+    threes = [rank for rank in range(12, -1, -1) if counts[rank] >= 3]
+    twos = [rank for rank in range(12, -1, -1) if counts[rank] >= 2]
+
+    def kickers(used, count):
+        # The `count` highest values of the ranks not in `used`, packed four bits each
+        return _TOP_VALUES[rank_mask & ~sum(1 << rank for rank in used)] >> 4 * (5 - count)
+
+    if fours:
+        kind, payload = PokerHandType.four_of_a_kind, (fours[0] + 2) << 16 | kickers(fours[:1], 1) << 12
+    elif threes and len(twos) >= 2:
+        pair = next(rank for rank in twos if rank != threes[0])
+        kind, payload = PokerHandType.full_house, (threes[0] + 2) << 16 | (pair + 2) << 12
+    elif straight_high[rank_mask]:
+        kind, payload = PokerHandType.straight, straight_high[rank_mask] << 16
+    elif threes:
+        kind, payload = PokerHandType.three_of_a_kind, (threes[0] + 2) << 16 | kickers(threes[:1], 2) << 8
+    elif len(twos) >= 2:
+        kind, payload = PokerHandType.two_pair, \
+            (twos[0] + 2) << 16 | (twos[1] + 2) << 12 | kickers(twos[:2], 1) << 8
+    elif twos:
+        kind, payload = PokerHandType.one_pair, (twos[0] + 2) << 16 | kickers(twos[:1], 3) << 4
+    else:
+        kind, payload = PokerHandType.high_card, _TOP_VALUES[rank_mask]
+    return _type_value(kind, short_deck) << _TYPE_SHIFT | payload
+
+
+def evaluate_ids(card_ids, short_deck: bool = False):
+    """Returns the strength of the best poker hand that can be made from card ids (any number of cards)
+
+    Args:
+        card_ids (iterable): Card ids, see PlayingCard
+        short_deck (bool): Whether to use the short deck ranking, see strength_type
+
+    Returns:
+        int: Hand strength, a higher strength is a better hand
+    """
+    count_key = 0
+    suit_counts = [0, 0, 0, 0]
+    suit_masks = [0, 0, 0, 0]
+    for card_id in card_ids:
+        count_key += _COUNT_UNIT[card_id]
+        suit_counts[card_id & 3] += 1
+        suit_masks[card_id & 3] |= 1 << (card_id >> 2)
+    return _strength(count_key, suit_counts, suit_masks, short_deck)
+
+
+def _strength(count_key: int, suit_counts: list, suit_masks: list, short_deck: bool = False):
+    """Returns the hand strength of packed rank counts and per suit card counts and rank bitmasks"""
+    rank_table = _SHORT_DECK_RANK_TABLE if short_deck else _RANK_TABLE
+    strength = rank_table.get(count_key)
+    if strength is None:
+        strength = rank_table[count_key] = _rank_strength(count_key, short_deck)
+
+    for suit in range(4):
+        if suit_counts[suit] >= 5:
+            high = (_SHORT_DECK_STRAIGHT_HIGH if short_deck else _STRAIGHT_HIGH)[suit_masks[suit]]
+            if high:
+                return max(strength, PokerHandType.straight_flush.value << _TYPE_SHIFT | high << 16)
+            strength = max(strength, _type_value(PokerHandType.flush, short_deck) << _TYPE_SHIFT
+                           | _TOP_VALUES[suit_masks[suit]])
+    return strength
+
+
+def evaluate(cards, short_deck: bool = False):
+    """Returns the strength of the best poker hand that can be made from a list of cards
+
+    Args:
+        cards (list): A list of playing cards
+        short_deck (bool): Whether to use the short deck ranking, see strength_type
+
+    Returns:
+        int: Hand strength, a higher strength is a better hand
+    """
+    return evaluate_ids([card.id for card in cards], short_deck)
+
+
+def strength_type(strength: int, short_deck: bool = False):
+    """Returns the PokerHandType of a hand strength
+
+    Args:
+        strength (int): Hand strength from evaluate
+        short_deck (bool): Whether the strength uses the short deck ranking, where a flush beats a full house
+            and ace to nine is the lowest straight
+
+    Returns:
+        PokerHandType: The hand type
+    """
+    value = strength >> _TYPE_SHIFT
+    return _HAND_TYPES[_SHORT_DECK_ORDER.get(value, value) if short_deck else value]
+
+
+class HandEvaluator:
+    """Incremental hand evaluation. Keeps the rank histogram and the per suit counts and rank bitmasks of
+    the cards added so far, so adding a card is O(1) and the current best hand is a table lookup and a
+    flush check, instead of going through all the cards again on every street.
+
+    Args:
+        cards (list): Cards to start with, e.g. the hole cards
+    """
+
+    def __init__(self, cards=()):
+        self.cards = []
+        self.card_mask = 0
+        self.count_key = 0
+        self.suit_counts = [0, 0, 0, 0]
+        self.suit_masks = [0, 0, 0, 0]
+        self._strength = None
+        self.add_cards(cards)
+
+    def add_card(self, card):
+        """Adds a card to the evaluated cards
+
+        Args:
+            card (PlayingCard): The card to add
+        """
+        if self.card_mask >> card.id & 1:
+            raise ValueError(f"{card} is already evaluated")
+        self.cards.append(card)
+        self.card_mask |= 1 << card.id
+        self.count_key += _COUNT_UNIT[card.id]
+        self.suit_counts[card.id & 3] += 1
+        self.suit_masks[card.id & 3] |= 1 << (card.id >> 2)
+        self._strength = None
+
+    def add_cards(self, cards):
+        """Adds a list of cards to the evaluated cards
+
+        Args:
+            cards (list): The cards to add
+        """
+        for card in cards:
+            self.add_card(card)
+
+    def clear(self):
+        """Removes all cards, e.g. for a new round
+        """
+        self.__init__()
+
+    def copy(self):
+        """Returns an independent evaluator with the same cards, e.g. to try out a card without adding it
+
+        Returns:
+            HandEvaluator: The copy
+        """
+        evaluator = HandEvaluator.__new__(HandEvaluator)
+        evaluator.cards = list(self.cards)
+        evaluator.card_mask, evaluator.count_key = self.card_mask, self.count_key
+        evaluator.suit_counts, evaluator.suit_masks = list(self.suit_counts), list(self.suit_masks)
+        evaluator._strength = self._strength
+        return evaluator
+
+    @property
+    def strength(self):
+        """int: Strength of the best poker hand of the cards so far, same as evaluate(cards)"""
+        if self._strength is None:
+            self._strength = _strength(self.count_key, self.suit_counts, self.suit_masks)
+        return self._strength
+
+    @property
+    def hand_type(self):
+        """PokerHandType: Type of the best poker hand of the cards so far"""
+        return strength_type(self.strength)
+
+    def best_poker_hand(self):
+        """Returns the best poker hand of the cards so far
+
+        Returns:
+            PokerHand: The best poker hand
+        """
+        return PokerHand(list(self.cards), self.strength)
+
+    def __len__(self):
+        return len(self.cards)
+
+
+_TOP_VALUES_ARRAY = np.array(_TOP_VALUES, dtype=np.int64)
+_STRAIGHT_HIGH_ARRAY = np.array(_STRAIGHT_HIGH, dtype=np.int64)
+_SHORT_DECK_STRAIGHT_HIGH_ARRAY = np.array(_SHORT_DECK_STRAIGHT_HIGH, dtype=np.int64)
+
+
+def evaluate_batch(card_ids, short_deck: bool = False):
+    """Evaluates many hands at once with NumPy, giving the same strengths as evaluate_ids
+
+    Args:
+        card_ids (array): (M, K) integer array of card ids, one hand of K cards per row
+        short_deck (bool): Whether to use the short deck ranking, see strength_type
+
+    Returns:
+        (array, array): M strengths and M PokerHandType values
+    """
+    card_ids = np.asarray(card_ids, dtype=np.int64)
+    straight_high = _SHORT_DECK_STRAIGHT_HIGH_ARRAY if short_deck else _STRAIGHT_HIGH_ARRAY
+    full_house_value = _type_value(PokerHandType.full_house, short_deck)
+    flush_value = _type_value(PokerHandType.flush, short_deck)
+    rows = len(card_ids)
+
+    def highest(rank_mask, count=1):
+        # The `count` highest values of a rank bitmask, packed four bits each
+        return _TOP_VALUES_ARRAY[rank_mask] >> 4 * (5 - count)
+
+    def bit(value):
+        return np.where(value > 0, np.int64(1) << np.maximum(value - 2, 0), 0)
+
+    def to_mask(held):
+        # Boolean arrays over the ranks, padded to 16 on the last axis, to rank bitmasks. Packing the flat
+        # array is much faster than packing along an axis.
+        packed = np.packbits(np.ascontiguousarray(held).ravel(), bitorder="little").view("<u2")
+        return packed.reshape(held.shape[:-1]).astype(np.int64)
+
+    ranks = card_ids >> 2
+    suits = card_ids & 3
+    hands = np.arange(rows)[:, None]
+
+    # Rank histograms and the bitmasks of ranks held at least 1, 2, 3 and 4 times
+    counts = np.bincount((hands * 16 + ranks).ravel(), minlength=rows * 16).reshape(rows, 16)
+    rank_mask, twos, threes, fours = (to_mask(counts >= n) for n in (1, 2, 3, 4))
+
+    four = highest(fours)
+    three = highest(threes)
+    pair = highest(twos)
+    second_pair = highest(twos, 2) & 15
+    full_house_pair = highest(twos & ~bit(three))
+    straight = straight_high[rank_mask]
+
+    conditions = [four > 0, (three > 0) & (full_house_pair > 0), straight > 0, three > 0, second_pair > 0,
+                  pair > 0]
+    choices = [
+        PokerHandType.four_of_a_kind.value << _TYPE_SHIFT | four << 16 | highest(rank_mask & ~bit(four)) << 12,
+        full_house_value << _TYPE_SHIFT | three << 16 | full_house_pair << 12,
+        PokerHandType.straight.value << _TYPE_SHIFT | straight << 16,
+        PokerHandType.three_of_a_kind.value << _TYPE_SHIFT | three << 16 | highest(rank_mask & ~bit(three), 2) << 8,
+        PokerHandType.two_pair.value << _TYPE_SHIFT | pair << 16 | second_pair << 12
+        | highest(rank_mask & ~bit(pair) & ~bit(second_pair)) << 8,
+        PokerHandType.one_pair.value << _TYPE_SHIFT | pair << 16 | highest(rank_mask & ~bit(pair), 3) << 4,
+    ]
+    strengths = np.select(conditions, choices, PokerHandType.high_card.value << _TYPE_SHIFT
+                          | _TOP_VALUES_ARRAY[rank_mask])
+
+    # Flushes and straight flushes, per suit
+    suit_counts = np.bincount((hands * 4 + suits).ravel(), minlength=rows * 4).reshape(rows, 4)
+    held = np.zeros((rows, 4, 16), dtype=bool)
+    held[hands, suits, ranks] = True
+    suit_masks = to_mask(held)
+    suit_straight = straight_high[suit_masks]
+    flushes = np.where(suit_counts >= 5, flush_value << _TYPE_SHIFT
+                       | _TOP_VALUES_ARRAY[suit_masks], 0)
+    straight_flushes = np.where((suit_counts >= 5) & (suit_straight > 0),
+                                PokerHandType.straight_flush.value << _TYPE_SHIFT | suit_straight << 16, 0)
+    strengths = np.maximum(strengths, np.maximum(flushes, straight_flushes).max(axis=1, initial=0))
+    types = strengths >> _TYPE_SHIFT
+    if short_deck:
+        types = np.select([types == full_house_value, types == flush_value],
+                          [PokerHandType.full_house.value, PokerHandType.flush.value], types)
+    return strengths, types
+
+
+# Omaha hands use exactly two of the four hole cards and three of the board cards
+_OMAHA_HOLE_PAIRS = list(combinations(range(4), 2))
+_LOW_BIT = [1 << (card_id >> 2) + 1 if card_id >> 2 <= 6 else 1 if card_id >> 2 == 12 else 0
+            for card_id in range(52)]  # Bit of the ace to eight cards, ace low, for the eight or better low
+NO_LOW = 1 << 20  #: Low value of hands without a qualifying low, worse than every low
+
+
+def _low_value(low_mask: int):
+    """Returns the value of a low hand from a bitmask of five ace low card values, lower is better"""
+    if bin(low_mask).count("1") != 5:
+        return NO_LOW
+    values = 0
+    for value in range(8, 0, -1):
+        if low_mask >> value - 1 & 1:
+            values = values << 4 | value
+    return values
+
+
+_LOW_VALUES = [_low_value(low_mask) for low_mask in range(1 << 8)]
+_LOW_VALUES_ARRAY = np.array(_LOW_VALUES, dtype=np.int64)
+
+
+def evaluate_omaha(hole_cards, board, hi_lo: bool = False):
+    """Returns the strength of the best Omaha hand: exactly two of the four hole cards and three of the board cards
+
+    Combinations are pruned before they are evaluated: the rank part only depends on the rank counts, so equal
+    counts are looked up once, and flushes are only checked for hole pairs of one suit with three board cards of
+    the same suit.
+
+    Args:
+        hole_cards (list): Four hole cards
+        board (list): Three to five board cards
+        hi_lo (bool): Whether to also find the eight or better low hand, for Omaha Hi-Lo
+
+    Returns:
+        int or (int, int): The hand strength, and with hi_lo the low value, lower is better and NO_LOW if the
+        hand has no low
+    """
+    hole = [card.id for card in hole_cards]
+    board = [card.id for card in board]
+    if len(hole) != 4 or not 3 <= len(board) <= 5:
+        raise ValueError("Omaha needs four hole cards and three to five board cards")
+    hole_pairs = [(hole[first], hole[second]) for first, second in _OMAHA_HOLE_PAIRS]
+    board_triples = list(combinations(board, 3))
+
+    count_keys = {_COUNT_UNIT[first] + _COUNT_UNIT[second] + sum(_COUNT_UNIT[card_id] for card_id in triple)
+                  for first, second in hole_pairs for triple in board_triples}
+    strength = 0
+    for count_key in count_keys:
+        rank_strength = _RANK_TABLE.get(count_key)
+        if rank_strength is None:
+            rank_strength = _RANK_TABLE[count_key] = _rank_strength(count_key)
+        strength = max(strength, rank_strength)
+
+    for first, second in hole_pairs:
+        suit = first & 3
+        if second & 3 != suit:
+            continue
+        for triple in board_triples:
+            if all(card_id & 3 == suit for card_id in triple):
+                suit_mask = 1 << (first >> 2) | 1 << (second >> 2) | sum(1 << (card_id >> 2) for card_id in triple)
+                high = _STRAIGHT_HIGH[suit_mask]
+                strength = max(strength, PokerHandType.straight_flush.value << _TYPE_SHIFT | high << 16 if high
+                               else PokerHandType.flush.value << _TYPE_SHIFT | _TOP_VALUES[suit_mask])
+    if not hi_lo:
+        return strength
+
+    low = min(_LOW_VALUES[_LOW_BIT[first] | _LOW_BIT[second] | _LOW_BIT[triple[0]] | _LOW_BIT[triple[1]]
+                          | _LOW_BIT[triple[2]]]
+              for first, second in hole_pairs for triple in board_triples)
+    return strength, low
+
+
+def evaluate_omaha_batch(hole_ids, board_ids, hi_lo: bool = False):
+    """Evaluates many Omaha hands at once with NumPy, giving the same results as evaluate_omaha
+
+    Every hand is split into its two hole card and three board card combinations, which are all evaluated in
+    one evaluate_batch call.
+
+    Args:
+        hole_ids (array): (M, 4) card ids of the hole cards
+        board_ids (array): (M, B) card ids of three to five board cards
+        hi_lo (bool): Whether to also find the eight or better low hands
+
+    Returns:
+        array or (array, array): M strengths, and with hi_lo the M low values
+    """
+    hole_ids = np.asarray(hole_ids, dtype=np.int64)
+    board_ids = np.asarray(board_ids, dtype=np.int64)
+    pairs = hole_ids[:, _OMAHA_HOLE_PAIRS]
+    triples = board_ids[:, list(combinations(range(board_ids.shape[1]), 3))]
+    hands = np.concatenate((np.repeat(pairs, triples.shape[1], axis=1),
+                            np.tile(triples, (1, pairs.shape[1], 1))), axis=2)
+    strengths = evaluate_batch(hands.reshape(-1, 5))[0].reshape(len(hands), -1).max(axis=1)
+    if not hi_lo:
+        return strengths
+    low_masks = np.bitwise_or.reduce(np.array(_LOW_BIT, dtype=np.int64)[hands], axis=2)
+    return strengths, _LOW_VALUES_ARRAY[low_masks].min(axis=1)
+
+
+class EvaluationCache:
+    """Least recently used cache of hand strengths. The key is a bitmask of the card set with the suits put
+    in a canonical order, so hands that only differ by a renaming of the suits share one entry.
+
+    Args:
+        maxsize (int): The max number of entries before the least recently used one is evicted
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def canonical_key(card_ids):
+        """Returns the suit-canonical bitmask of a set of card ids
+
+        Args:
+            card_ids (list): Card ids, see PlayingCard
+
+        Returns:
+            int: 52-bit key, or None if a card appears more than once (a set can't represent that)
+        """
+        suit_masks = [0, 0, 0, 0]
+        for card_id in card_ids:
+            suit_masks[card_id & 3] |= 1 << (card_id >> 2)
+        suit_masks.sort()
+        key = suit_masks[0] | suit_masks[1] << 13 | suit_masks[2] << 26 | suit_masks[3] << 39
+        if sum(mask.bit_count() for mask in suit_masks) != len(card_ids):
+            return None
+        return key
+
+    def strength(self, cards):
+        """Returns the strength of a list of cards, from the cache when possible
+
+        Args:
+            cards (list): A list of playing cards
+
+        Returns:
+            int: Hand strength
+        """
+        card_ids = [card.id for card in cards]
+        key = self.canonical_key(card_ids)
+        if key is None:
+            return evaluate_ids(card_ids)
+        strength = self._entries.get(key)
+        if strength is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return strength
+        self.misses += 1
+        strength = self._entries[key] = evaluate_ids(card_ids)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return strength
+
+    def info(self):
+        """Returns the hits, misses, current size and max size of the cache as a dictionary"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "maxsize": self.maxsize}
+
+    def clear(self):
+        """Empties the cache and resets the counters"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+evaluation_cache = EvaluationCache()  #: The cache used by Hand.best_poker_hand
+
+
+_HAND_TYPES = {hand_type.value: hand_type for hand_type in PokerHandType}
+hand_key = attrgetter("strength")  #: Sort key function for poker hands, e.g. max(hands, key=hand_key)
+
+
 class PokerHand:
-    """Class representing a poker hand
+    """Class representing a poker hand. The hand is evaluated to an integer strength with lookup tables,
+    so comparing two hands is an integer compare, and the strength is a total order key for sorting, see
+    hand_key. The check methods are the original step by step checkers
+    and are kept as a readable reference.
 
     Args:
         cards (list): list of cards
+        strength (int): The strength of the cards if already known, e.g. from an EvaluationCache
     """
 
-    def __init__(self, cards):
-        functions = [self.check_straight_flush, self.check_four_of_a_kind,
-                     self.check_full_house, self.check_flush, self.check_straight,
-                     self.check_three_of_a_kind, self.check_two_pair,
-                     self.check_one_pair, self.check_high_card]
-
-        # Checks the best possible poker hand from best to worst
-        for function in functions:
-            result = function(cards)
-            if result is not None:
-                self.hand_type, self.values = result
-                break
+    def __init__(self, cards, strength=None):
+        self.cards = cards
+        self.strength = evaluate(cards) if strength is None else strength
+        self.hand_type = _HAND_TYPES[self.strength >> _TYPE_SHIFT]
+
+    @property
+    def values(self):
+        """The values that decide between hands of the same type, in the same shape as the check methods"""
+        values = [self.strength >> shift & 15 for shift in (16, 12, 8, 4, 0)]
+        values = [value for value in values if value]
+        if self.hand_type in (PokerHandType.straight_flush, PokerHandType.straight):
+            return values[0]
+        elif self.hand_type == PokerHandType.four_of_a_kind:
+            return values[0], values[1:2]
+        elif self.hand_type == PokerHandType.full_house:
+            return values[0], values[1]
+        elif self.hand_type == PokerHandType.flush:
+            return self.check_flush(self.cards)[1]
+        elif self.hand_type == PokerHandType.three_of_a_kind:
+            return values[0], values[1:3]
+        elif self.hand_type == PokerHandType.two_pair:
+            return [values[1], values[0]], values[2:3]
+        elif self.hand_type == PokerHandType.one_pair:
+            return values[0], values[1:4]
+        return values
 
     @staticmethod
     def check_straight_flush(cards):
@@ -438,7 +1040,7 @@ class PokerHand:
             for flush in suits:
                 if suits.count(flush) >= 5:
                     flush_cards = [x for x in cards if x.suit == flush]
-                    return PokerHandType.flush, (sorted(flush_cards, reverse=True))[:5]
+                    return PokerHandType.flush, (sorted(flush_cards, key=card_key, reverse=True))[:5]
 
     @staticmethod
     def check_straight(cards):
@@ -548,48 +1150,310 @@ class PokerHand:
         return f"{self.hand_type} with {self.values[0]}"
 
     def __lt__(self, other):
-        """Defines the "less than" comparing between values
+        """Defines the "less than" comparing between hands
 
         Args:
-            other (PokerHand, list): other card value
+            other (PokerHand): other poker hand
 
         Returns:
-            PokerHand, int: returns the smaller value
+            bool: True if this hand is worse
         """
-        return (self.hand_type, self.values) < (other.hand_type, other.values)
+        return self.strength < other.strength
 
     def __eq__(self, other):
-        return (self.hand_type, self.values) == (other.hand_type, other.values)
+        return self.strength == other.strength
+
+
+HAND_RECORD = np.dtype([("cards", "<u8"), ("strength", "<i4"), ("hand_type", "u1")])
+"""dtype: One hand of a HandBatch: the bitmask of its card ids, its strength and its PokerHandType value"""
+
+
+class HandBatch:
+    """Many evaluated hands in one NumPy structured array of HAND_RECORD, 13 bytes per hand. Slices are views
+    of the same memory, and PokerHand objects are only made when a single hand is asked for.
+
+    Args:
+        records (array): Structured array of HAND_RECORD
+    """
+
+    def __init__(self, records):
+        if records.dtype != HAND_RECORD:
+            raise ValueError("A HandBatch needs an array of HAND_RECORD")
+        self.records = records
+
+    @classmethod
+    def from_ids(cls, card_ids):
+        """Evaluates hands of card ids into a batch
+
+        Args:
+            card_ids (array): (M, K) card ids, one hand of K cards per row
+
+        Returns:
+            HandBatch: The evaluated hands
+        """
+        card_ids = np.asarray(card_ids, dtype=np.int64)
+        strengths, types = evaluate_batch(card_ids)
+        records = np.empty(len(card_ids), dtype=HAND_RECORD)
+        records["cards"] = np.bitwise_or.reduce(np.uint64(1) << card_ids.astype(np.uint64), axis=1)
+        records["strength"] = strengths
+        records["hand_type"] = types
+        return cls(records)
+
+    @classmethod
+    def from_poker_hands(cls, poker_hands):
+        """Packs PokerHand objects into a batch
+
+        Args:
+            poker_hands (list): PokerHand objects
+
+        Returns:
+            HandBatch: The hands
+        """
+        records = np.array([(sum(1 << card.id for card in set(poker_hand.cards)), poker_hand.strength,
+                             poker_hand.hand_type.value) for poker_hand in poker_hands], dtype=HAND_RECORD)
+        return cls(records.reshape(-1))
+
+    @classmethod
+    def concatenate(cls, batches):
+        """Joins batches into one, copying the records
+
+        Args:
+            batches (list): HandBatch objects
+
+        Returns:
+            HandBatch: All the hands in order
+        """
+        return cls(np.concatenate([batch.records for batch in batches]))
+
+    @property
+    def strength(self):
+        """array: Strength of every hand, a view of the records"""
+        return self.records["strength"]
+
+    @property
+    def hand_type(self):
+        """array: PokerHandType value of every hand, a view of the records"""
+        return self.records["hand_type"]
+
+    def card_ids(self, index: int):
+        """Returns the card ids of one hand in ascending order
+
+        Args:
+            index (int): Row of the hand
+
+        Returns:
+            list: Card ids
+        """
+        cards = int(self.records["cards"][index])
+        return [card_id for card_id in range(52) if cards >> card_id & 1]
+
+    def poker_hand(self, index: int):
+        """Returns one hand as a PokerHand
+
+        Args:
+            index (int): Row of the hand
+
+        Returns:
+            PokerHand: The hand, with the strength from the batch
+        """
+        return PokerHand([CARDS[card_id] for card_id in self.card_ids(index)], int(self.strength[index]))
+
+    def poker_hands(self):
+        """Returns all hands as PokerHand objects, only meant for small batches
+
+        Returns:
+            list: PokerHand objects
+        """
+        return [self.poker_hand(index) for index in range(len(self))]
+
+    def argsort(self):
+        """Returns the rows in order of ascending strength, equal hands keep their order"""
+        return np.argsort(self.strength, kind="stable")
+
+    def sorted(self):
+        """Returns a copy of the batch sorted by ascending strength
+
+        Returns:
+            HandBatch: The sorted hands
+        """
+        return HandBatch(self.records[self.argsort()])
+
+    def group_by_type(self):
+        """Groups the hands by type, every group is a view of a sorted copy of the records
+
+        Returns:
+            dict: PokerHandType to a HandBatch of the hands of that type
+        """
+        records = self.records[np.argsort(self.hand_type, kind="stable")]
+        values, starts = np.unique(records["hand_type"], return_index=True)
+        ends = list(starts[1:]) + [len(records)]
+        return {_HAND_TYPES[int(value)]: HandBatch(records[start:end])
+                for value, start, end in zip(values, starts, ends)}
+
+    def type_counts(self):
+        """Counts the hands of every type
+
+        Returns:
+            dict: PokerHandType to the number of hands of that type
+        """
+        counts = np.bincount(self.hand_type, minlength=len(_HAND_TYPES) + 1)
+        return {hand_type: int(counts[hand_type.value]) for hand_type in PokerHandType if counts[hand_type.value]}
+
+    def save(self, filename):
+        """Saves the records to a .npy file
+
+        Args:
+            filename (str): The file to write
+        """
+        np.save(filename, self.records)
+
+    @classmethod
+    def load(cls, filename, mmap: bool = True):
+        """Loads a batch saved with save
+
+        Args:
+            filename (str): The file to read
+            mmap (bool): Whether to memory-map the file instead of reading it
+
+        Returns:
+            HandBatch: The hands, read-only if memory-mapped
+        """
+        return cls(np.load(filename, mmap_mode="r" if mmap else None))
+
+    def __getitem__(self, index):
+        """A single row gives a PokerHand, a slice gives a HandBatch view and an index array a HandBatch copy"""
+        if isinstance(index, (int, np.integer)):
+            return self.poker_hand(index)
+        return HandBatch(self.records[index])
+
+    def __len__(self):
+        return len(self.records)
+
+
+class Outs:
+    """The cards that improve a hand on the next street, and the chances to improve by the river.
+    A card improves the hand if the best poker hand gets a better PokerHandType with it.
+
+    Args:
+        cards (list): The hole cards and the cards on the table, five or six cards
+    """
+
+    def __init__(self, cards):
+        if len(cards) not in (5, 6):
+            raise ValueError("Outs need the hole cards and the flop or the turn")
+        known = [card.id for card in cards]
+        if len(set(known)) != len(known):
+            raise ValueError("A card can't be dealt twice")
+        self.hand_type = strength_type(evaluate_ids(known))
+        unseen = np.setdiff1d(np.arange(52), known)
+        self.unseen = len(unseen)
+
+        next_types = evaluate_batch(np.column_stack((np.broadcast_to(known, (len(unseen), len(known))), unseen)))[1]
+        improving = next_types > self.hand_type.value
+        self.cards = [CARDS[card_id] for card_id in unseen[improving]]
+        self.hand_types = [_HAND_TYPES[value] for value in next_types[improving]]
+
+        if len(known) == 5:  # Both the turn and the river are to come
+            runouts = np.array(list(combinations(unseen, 2)), dtype=np.int64)
+            river_types = evaluate_batch(np.concatenate((np.broadcast_to(known, (len(runouts), 5)), runouts),
+                                                        axis=1))[1]
+        else:
+            river_types = next_types
+        values, counts = np.unique(river_types, return_counts=True)
+        self.river_types = {_HAND_TYPES[value]: count / len(river_types) for value, count in zip(values, counts)}
+
+    @property
+    def next_street(self):
+        """float: Chance that the next card improves the hand"""
+        return len(self.cards) / self.unseen
+
+    @property
+    def by_river(self):
+        """float: Chance that the hand has improved by the river"""
+        return sum(chance for hand_type, chance in self.river_types.items() if hand_type > self.hand_type)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __str__(self):
+        return f"{len(self.cards)} outs to improve {self.hand_type}: {100 * self.next_street:.1f} % on the next " \
+               f"card, {100 * self.by_river:.1f} % by the river"
 
 
 class StandardDeck:
     """Creates a standard deck of cards (52 cards, 4 suits) using the subclasses of PlayingCard
+
+    The deck is an array of card ids with a cursor at the top card, so drawing and resetting never move or
+    allocate cards. Every deck shuffles with its own NumPy generator.
+
+    Args:
+        seed (int, Generator): Seed or generator for shuffling, a random seed if None
     """
 
-    def __init__(self):
-        self.cards = []
-        for suit in Suit:
-            for value in range(2, 11):
-                self.cards.append(NumberedCard(value, suit))
-            self.cards.append(KingCard(suit))
-            self.cards.append(QueenCard(suit))
-            self.cards.append(JackCard(suit))
-            self.cards.append(AceCard(suit))
+    # The cards are interned, so every deck shares these objects
+    _order = [make_card(value, suit) for suit in Suit for value in [2, 3, 4, 5, 6, 7, 8, 9, 10, 13, 12, 11, 14]]
+    _order_ids = np.array([card.id for card in _order], dtype=np.int8)
+
+    def __init__(self, seed=None):
+        self.ids = self._order_ids.copy()
+        self.position = 0
+        self.rng = np.random.default_rng(seed)
+
+    @property
+    def cards(self):
+        """list: The cards left in the deck, top card first"""
+        return [CARDS[card_id] for card_id in self.ids[self.position:]]
 
     def shuffle(self):
-        """Shuffles the deck"""
-        random.shuffle(self.cards)
+        """Shuffles the cards left in the deck"""
+        self.rng.shuffle(self.ids[self.position:])
 
     def draw(self):
         """Draw the top card from the deck"""
-        return self.cards.pop(0)
+        if self.position == len(self.ids):
+            raise IndexError("draw from an empty deck")
+        self.position += 1
+        return CARDS[self.ids[self.position - 1]]
+
+    def deal(self, count: int):
+        """Draws several cards at once
+
+        Args:
+            count (int): Number of cards to draw
+
+        Returns:
+            list: The drawn cards, top card first
+        """
+        if self.position + count > len(self.ids):
+            raise IndexError("draw from an empty deck")
+        self.position += count
+        return [CARDS[card_id] for card_id in self.ids[self.position - count:self.position]]
+
+    def reset(self):
+        """Puts every card back in the original order"""
+        self.ids[:] = self._order_ids
+        self.position = 0
+
+    @classmethod
+    def shuffled_ids(cls, count: int, seed=None):
+        """Shuffles many independent decks at once, for simulations
+
+        Args:
+            count (int): Number of decks
+            seed (int, Generator): Seed or generator, a random seed if None
+
+        Returns:
+            array: (count, 52) array of card ids, one shuffled deck per row
+        """
+        rng = np.random.default_rng(seed)
+        return rng.permuted(np.broadcast_to(cls._order_ids, (count, 52)), axis=1)
 
     def __len__(self):
         """
         Returns:
             int: returns the length of the cards
         """
-        return len(self.cards)
+        return len(self.ids) - self.position
 
     def __str__(self):
         return str(self.cards)
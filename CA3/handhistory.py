@@ -0,0 +1,135 @@
+import os
+import numpy as np
+
+"""Append-only binary hand history: one fixed-width record per game event, written through a buffer and read
+back memory-mapped, so whole archives can be scanned with NumPy without parsing.
+Created by Rikard Radovac & Péter Gaal in the course DAT171 at Chalmers university of technology
+"""
+
+HISTORY_MAGIC = b"CA3HIST1"
+"""bytes: First bytes of a hand history file, followed by the records"""
+
+HISTORY_RECORD = np.dtype([("hand", "<u4"), ("action", "u1"), ("player", "u1"), ("cards", "i1", (5,)),
+                           ("amount", "<u4"), ("pot", "<u4")])
+"""dtype: One event, 19 bytes. cards holds card ids, padded with -1, amount is the chips of the action and pot
+the pot after it"""
+
+DEAL, BOARD, BET, CALL, FOLD, WIN = range(6)
+"""int: Action codes. DEAL records a player's hole cards and BOARD the cards put on the table"""
+
+ACTION_NAMES = ["deal", "board", "bet", "call", "fold", "win"]
+"""list: Names of the action codes"""
+
+
+class HandHistoryWriter:
+    """Buffered writer of a hand history file. New records are appended, so a file can collect many sessions,
+    and the hand numbers continue from the last hand in the file.
+
+    :param filename: The file to append to
+    :param buffer_size: Number of records kept in memory before they are written
+    """
+
+    def __init__(self, filename, buffer_size=4096):
+        self.filename = filename
+        self.buffer = np.zeros(buffer_size, dtype=HISTORY_RECORD)
+        self.buffered = 0
+        records = read_history(filename) if os.path.exists(filename) and os.path.getsize(filename) else None
+        self.hand = int(records["hand"][-1]) if records is not None and len(records) else 0
+        self.file = open(filename, "ab")
+        if self.file.tell() == 0:
+            self.file.write(HISTORY_MAGIC)
+
+    def new_hand(self):
+        """Starts the records of a new hand"""
+        self.hand += 1
+
+    def record(self, action, player=0, cards=(), amount=0, pot=0):
+        """Adds one event to the buffer and writes the buffer to the file when it is full
+
+        :param action: Action code, like BET
+        :param player: Index of the player
+        :param cards: Up to five cards of the event
+        :param amount: Chips of the action
+        :param pot: The pot after the action
+        """
+        card_ids = [card.id for card in cards] + [-1] * (5 - len(cards))
+        self.buffer[self.buffered] = (self.hand, action, player, card_ids, amount, pot)
+        self.buffered += 1
+        if self.buffered == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered records to the file"""
+        self.file.write(self.buffer[:self.buffered].tobytes())
+        self.file.flush()
+        self.buffered = 0
+
+    def close(self):
+        """Writes the buffered records and closes the file"""
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def read_history(filename):
+    """Memory-maps the records of a hand history file, nothing is read until it is used
+
+    :param filename: The file to read
+    :return records: Read-only structured array of HISTORY_RECORD
+    """
+    with open(filename, "rb") as file:
+        if file.read(len(HISTORY_MAGIC)) != HISTORY_MAGIC:
+            raise ValueError(f"{filename} is not a hand history file")
+    count = (os.path.getsize(filename) - len(HISTORY_MAGIC)) // HISTORY_RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=HISTORY_RECORD)
+    return np.memmap(filename, dtype=HISTORY_RECORD, mode="r", offset=len(HISTORY_MAGIC), shape=(count,))
+
+
+def hand_starts(records):
+    """Finds where every hand starts in the records
+
+    :param records: Records from read_history
+    :return starts: Index of the first record of every hand, followed by the number of records
+    """
+    hands = records["hand"]
+    return np.concatenate(([0], np.flatnonzero(hands[1:] != hands[:-1]) + 1, [len(hands)]))
+
+
+def iter_hands(filename, chunk=1 << 20):
+    """Streams the hands of a hand history file, reading chunk records at a time
+
+    :param filename: The file to read
+    :param chunk: Number of records to scan at a time
+    :return hands: Generator of the records of one hand at a time, views of the mapped file
+    """
+    records = read_history(filename)
+    start = 0
+    while start < len(records):
+        window = records[start:start + chunk]
+        starts = hand_starts(window)
+        # The last hand of a window may go on in the next window, unless the window reaches the end of the file
+        last = len(starts) - 1 if start + len(window) == len(records) else len(starts) - 2
+        if last == 0:  # A hand longer than the window
+            chunk *= 2
+            continue
+        for first, end in zip(starts[:last], starts[1:last + 1]):
+            yield window[first:end]
+        start += int(starts[last])
+
+
+def winnings(records, players=None):
+    """Sums up the winnings of every player with one pass over the records
+
+    :param records: Records from read_history
+    :param players: Number of players, found from the records if None
+    :return winnings: Chips won by every player
+    """
+    wins = records[records["action"] == WIN]
+    return np.bincount(wins["player"], weights=wins["amount"], minlength=players or 0).astype(np.int64)
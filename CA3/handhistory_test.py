@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from cardlib import CARDS
+from handhistory import *
+
+
+def write_hands(filename, hands, buffer_size=4096):
+    """Writes hands of a deal, a bet per player and a win to the file, and returns the writer's last hand number"""
+    with HandHistoryWriter(filename, buffer_size) as writer:
+        for bets, winner in hands:
+            writer.new_hand()
+            writer.record(DEAL, 0, CARDS[:2])
+            writer.record(DEAL, 1, CARDS[2:4])
+            pot = 0
+            for player, bet in enumerate(bets):
+                pot += bet
+                writer.record(BET, player % 2, amount=bet, pot=pot)
+            writer.record(BOARD, cards=CARDS[4:9])
+            writer.record(WIN, winner, amount=pot, pot=pot)
+        return writer.hand
+
+
+def test_round_trip(tmp_path):
+    """Tests writing, reading back and appending to a hand history file"""
+    filename = str(tmp_path / "history.bin")
+    assert write_hands(filename, [([10, 10], 0), ([5, 5, 20, 20], 1)], buffer_size=3) == 2
+    records = read_history(filename)
+    assert len(records) == 14
+    assert records["hand"].tolist() == [1] * 6 + [2] * 8
+    assert records["cards"][0].tolist() == [0, 1, -1, -1, -1]
+    assert records["cards"][3].tolist() == [-1] * 5
+    assert records["cards"][-2].tolist() == [4, 5, 6, 7, 8]
+    assert records["pot"][-1] == 50
+
+    # A new writer continues the hand numbers of the file
+    assert write_hands(filename, [([1], 1)]) == 3
+    records = read_history(filename)
+    assert len(records) == 19 and records["hand"][-1] == 3
+    assert hand_starts(records).tolist() == [0, 6, 14, 19]
+    assert winnings(records).tolist() == [20, 51]
+    assert winnings(records, players=4).tolist() == [20, 51, 0, 0]
+
+
+def test_empty_history(tmp_path):
+    """Tests reading a file with only the header and one that is not a hand history"""
+    filename = str(tmp_path / "history.bin")
+    HandHistoryWriter(filename).close()
+    records = read_history(filename)
+    assert len(records) == 0 and records.dtype == HISTORY_RECORD
+    assert list(iter_hands(filename)) == []
+    assert winnings(records, players=2).tolist() == [0, 0]
+    assert write_hands(filename, [([2], 0)]) == 1
+
+    other = tmp_path / "other.bin"
+    other.write_bytes(b"not a history")
+    with pytest.raises(ValueError):
+        read_history(str(other))
+
+
+def test_iter_hands(tmp_path):
+    """Tests that streaming in small windows gives every hand whole, also hands longer than a window"""
+    filename = str(tmp_path / "history.bin")
+    write_hands(filename, [([1] * 2, 0), ([1] * 9, 1), ([1] * 3, 0), ([1] * 20, 1)])
+    records = read_history(filename)
+    starts = hand_starts(records)
+    for chunk in (4, 7, 1 << 20):
+        hands = list(iter_hands(filename, chunk=chunk))
+        assert [len(hand) for hand in hands] == np.diff(starts).tolist()
+        assert [int(hand["hand"][0]) for hand in hands] == [1, 2, 3, 4]
+        assert all((hand["hand"] == hand["hand"][0]).all() for hand in hands)
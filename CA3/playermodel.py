@@ -1,5 +1,6 @@
 from PyQt5.QtCore import QObject, pyqtSignal
 import cardlib as cl
+import handhistory as hh
 from abc import abstractmethod
 
 
@@ -57,6 +58,7 @@ class PlayerModel(QObject):
         self.name = name
         self.money = 1000
         self.hand = hand
+        self.evaluator = cl.HandEvaluator()  # The hole cards and the table, updated as cards are dealt
         self.total_bet = 0
         self.has_folded = False
         self.has_called = False
@@ -76,6 +78,7 @@ class PlayerModel(QObject):
     def fold(self):
         """Defines that the player has folded and removes its cards"""
         self.hand.fold()
+        self.evaluator.clear()
         self.has_folded = True
         self.update_data.emit()
 
@@ -85,14 +88,20 @@ class PlayerModel(QObject):
         self.total_bet += amount
         self.update_data.emit()
 
+    def best_hand(self):
+        """Returns the best poker hand of the players cards and the cards on the table so far"""
+        return self.evaluator.best_poker_hand()
+
 
 class GameState(QObject):
     """Class representing the Texas Hold'em poker game"""
     update_state = pyqtSignal()
     game_message = pyqtSignal((str,))
 
-    def __init__(self):
+    def __init__(self, history_file=None):
+        """:param history_file: File to append the hand history to, no history is kept if None"""
         super().__init__()
+        self.history = hh.HandHistoryWriter(history_file) if history_file else None
         self.call_count = None
         self.names = ["Rikard", "Peter"]  # Hard-coded names
         self.running = False
@@ -111,8 +120,29 @@ class GameState(QObject):
         for player in self.players:
             for ind in range(2):
                 player.hand.add_card(self.deck.draw())
+            player.evaluator.add_cards(player.hand.cards + self.flop.cards)
+        if self.history is not None:
+            self.history.new_hand()
+            for index, player in enumerate(self.players):
+                self.record(hh.DEAL, player.hand.cards, player=index)
+            self.record(hh.BOARD, self.flop.cards)
         self.update_state.emit()
 
+    def record(self, action, cards=(), amount=0, player=None):
+        """Appends an action to the hand history, if one is kept
+        :param action: Action code from handhistory
+        :param cards: Cards of the action
+        :param amount: Chips of the action
+        :param player: Index of the player, the player in turn if None
+        """
+        if self.history is not None:
+            self.history.record(action, self.player_turn if player is None else player, cards, amount, self.pot)
+
+    def close(self):
+        """Writes the rest of the hand history to its file"""
+        if self.history is not None:
+            self.history.close()
+
     def bet(self, amount):
         """Handles the bets and its logic
         :param amount: The bet amount
@@ -127,6 +157,7 @@ class GameState(QObject):
                 player.is_all_in = True
             self.pot += amount
             player.bet(amount)
+            self.record(hh.BET, amount=amount)
             self.bets.append(amount)
             for players in self.players:
                 players.has_called = False
@@ -152,11 +183,14 @@ class GameState(QObject):
                     player.bet(self.bets[-1])
                     self.bets.append(self.bets[-1])
                     self.pot += self.bets[-1]
+                    self.record(hh.CALL, amount=self.bets[-1])
                     player.has_called = True
 
                 else:  # Call an all-in
-                    self.pot += player.money
-                    player.bet(player.money)
+                    amount = player.money
+                    self.pot += amount
+                    player.bet(amount)
+                    self.record(hh.CALL, amount=amount)
                     player.has_called = True
                     player.is_all_in = True
         else:
@@ -169,6 +203,7 @@ class GameState(QObject):
         """Defines how the model handles if a player folds"""
 
         self.players[self.player_turn].fold()
+        self.record(hh.FOLD)
         remaining_players = [player for player in self.players if not player.has_folded]
         if len(remaining_players) <= 1:
             self.winner()
@@ -194,11 +229,13 @@ class GameState(QObject):
         self.player_turn = (self.player_turn + 1) % len(self.players)
         for player in self.players:
             player.hand.cards.clear()
+            player.evaluator.clear()
+            player.has_folded = False
             player.is_all_in = False
             player.has_called = False
         self.bets = [0]
         self.running = False
-        self.deck = cl.StandardDeck()
+        self.deck.reset()
         self.flop.cards.clear()
         self.update_state.emit()
         self.start()
@@ -212,8 +249,12 @@ class GameState(QObject):
         proceed = all([player.has_folded or player.has_called for player in self.players])
 
         if proceed and len(self.flop.cards) < 5:
-            self.flop.add_card(self.deck.draw())
-            for player in self.players: player.has_called = False
+            card = self.deck.draw()
+            self.flop.add_card(card)
+            self.record(hh.BOARD, [card])
+            for player in self.players:
+                player.has_called = False
+                player.evaluator.add_card(card)
             return
         if proceed and len(self.flop.cards) >= 5:
             for player in self.players: player.has_called = False
@@ -228,13 +269,16 @@ class GameState(QObject):
     def winner(self):
         """Calculates and informs who the winner is"""
         hands = []
-        for player in self.players: hands.append(player.hand.best_poker_hand(self.flop.cards))
-        winner = hands.index(max(hands))
+        for player in self.players: hands.append(player.best_hand())
+        # Players who folded can't win the pot
+        strengths = [hand.strength if not player.has_folded else -1 for player, hand in zip(self.players, hands)]
+        winner = strengths.index(max(strengths))
         for not_winner in self.players:
             if not_winner == self.players[winner]:
                 pass
             not_winner.loss()
 
+        self.record(hh.WIN, amount=self.pot, player=winner)
         self.players[winner].win(self.pot)
         self.pot = 0
         self.game_message.emit(f"{self.players[winner].name} Won the round with the hand: "
@@ -8,10 +8,12 @@ import sys
 app = QApplication(sys.argv)
 
 box = QVBoxLayout()
-box.addWidget(pw.GameView(pm.GameState()))
+game = pm.GameState("HandHistory.bin")  # Every hand played is appended to the hand history
+box.addWidget(pw.GameView(game))
 game_view = QGroupBox()
 
 game_view.setLayout(box)
 game_view.show()
 
 app.exec_()
+game.close()